@@ -1,14 +1,99 @@
 import os
 import json
-import base64
 import tempfile
 from http.server import BaseHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
-import cgi
+import hashlib
 import io
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+import math
+import re
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from datetime import timezone
+
+# pybase64 is a SIMD-accelerated drop-in for the stdlib module
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+# orjson serializes straight to bytes, skipping the str -> utf-8 encode pass
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# streaming-form-data parses multipart bodies in C straight off the socket;
+# fall back to the stdlib cgi parser when it is not installed
+try:
+    from streaming_form_data import StreamingFormDataParser
+    from streaming_form_data.targets import ValueTarget
+    STREAMING_FORM_DATA_AVAILABLE = True
+except ImportError:
+    import cgi
+    STREAMING_FORM_DATA_AVAILABLE = False
+
+# Debug diagnostics go through logging so production (LOG_LEVEL=INFO) skips formatting them.
+# The handler is attached to this module's logger only, leaving the root logger to importers
+logger = logging.getLogger(__name__)
+_log_level = logging.getLevelName(os.getenv('LOG_LEVEL', 'INFO').upper())
+# getLevelName returns a string for unknown names; fall back to INFO rather than failing import
+logger.setLevel(_log_level if isinstance(_log_level, int) else logging.INFO)
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_log_handler)
+    logger.propagate = False
+
+# Shared worker pool for running model requests alongside the request thread
+_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+# Shared HTTP session so Vertex AI calls reuse pooled keep-alive TCP/TLS connections
+_SESSION = requests.Session()
+# Vertex AI :predict has no side effects, so POSTs are retried on quota (429) and
+# transient 5xx responses too; the last response is returned rather than raised so
+# callers can log it
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {'POST'},
+        raise_on_status=False
+    )
+))
+
+# Keep-alive session for the storage API. It has no retry policy, because
+# storing an analysis is not idempotent and must not be replayed
+_STORAGE_SESSION = requests.Session()
+
+# Per-thread scratch buffer reused for JPEG-encoding annotated images
+_ENCODE_BUFFERS = threading.local()
+
+def dumps_json_bytes(obj):
+    """Serialize obj to compact UTF-8 JSON bytes, using orjson when installed"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+def loads_json(data):
+    """Parse JSON from bytes or str, using orjson when installed"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
 
 # PostgreSQL storage via Node.js API endpoint
 POSTGRES_AVAILABLE = True  # Always available since we use HTTP API
@@ -18,45 +103,44 @@ def store_analysis_results_via_api(user_id, analysis_data):
     try:
         # Call the Node.js storage API
         api_url = f"{os.getenv('VERCEL_URL', 'http://localhost:3000')}/api/store-analysis"
-        print(f"🔍 Calling storage API: {api_url}")
+        logger.debug("🔍 Calling storage API: %s", api_url)
         
         payload = {
             'user_id': user_id,
             'analysis_data': analysis_data
         }
         
-        print(f"🔍 Payload: {json.dumps(payload, indent=2)}")
+        # The payload holds every prediction, only pretty-print it when DEBUG is on
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔍 Payload: %s", json.dumps(payload, indent=2))
         
-        response = requests.post(
+        response = _STORAGE_SESSION.post(
             api_url,
             json=payload,
             headers={'Content-Type': 'application/json'},
             timeout=10
         )
         
-        print(f"🔍 API Response status: {response.status_code}")
-        print(f"🔍 API Response headers: {dict(response.headers)}")
-        print(f"🔍 API Response text: {response.text}")
+        logger.debug("🔍 API Response status: %s", response.status_code)
+        logger.debug("🔍 API Response text: %s", response.text)
         
         if response.status_code == 200:
             result = response.json()
-            print(f"🔍 Parsed response: {json.dumps(result, indent=2)}")
+            logger.debug("🔍 Parsed response: %s", result)
             
             if result.get('status') == 'success':
                 upload_id = result.get('upload_id')
-                print(f"✅ Analysis results stored via API with upload_id: {upload_id}")
+                logger.debug("✅ Analysis results stored via API with upload_id: %s", upload_id)
                 return upload_id
             else:
-                print(f"⚠️ API returned error: {result.get('message')}")
+                logger.warning("⚠️ API returned error: %s", result.get('message'))
                 return None
         else:
-            print(f"❌ API call failed with status {response.status_code}: {response.text}")
+            logger.error("❌ API call failed with status %s: %s", response.status_code, response.text)
             return None
             
     except Exception as e:
-        print(f"❌ Error calling storage API: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error calling storage API: %s", e)
         return None
 
 # Only import Google Auth if available (reduces bundle size)
@@ -65,9 +149,12 @@ try:
     from google.auth.transport.requests import Request
     from google.oauth2 import service_account
     GOOGLE_AUTH_AVAILABLE = True
+    # Token refreshes get their own keep-alive session without the predict retry policy,
+    # so a failing token endpoint is not retried while _token_lock is held
+    _AUTH_REQUEST = Request(session=requests.Session())
 except ImportError:
     GOOGLE_AUTH_AVAILABLE = False
-    print("⚠️ Google Auth not available - using mock mode")
+    logger.warning("⚠️ Google Auth not available - using mock mode")
 
 # Configure Google Cloud credentials
 project_id = os.getenv('GOOGLE_CLOUD_PROJECT', '27458468732')
@@ -80,28 +167,31 @@ thickness_endpoint_id = os.getenv('THICKNESS_ENDPOINT_ID', '8594040168418115584'
 thickness_location = os.getenv('THICKNESS_LOCATION', 'europe-west4')
 
 def check_vertex_ai_enabled():
-    """Check if Vertex AI is properly configured - called at runtime"""
+    """Check if Vertex AI is properly configured - called once at startup"""
     if not GOOGLE_AUTH_AVAILABLE:
-        print("⚠️ Google Auth library not available")
+        logger.warning("⚠️ Google Auth library not available")
         return False
         
-    enabled = all([
-        os.getenv('GOOGLE_CLOUD_PROJECT'),
-        os.getenv('VERTEX_ENDPOINT_ID'),
-        os.getenv('VERTEX_LOCATION'),
-        os.getenv('GOOGLE_CREDENTIALS')
-    ])
-    
-    print(f"🔍 Runtime environment check:")
-    print(f"  - GOOGLE_CLOUD_PROJECT: {os.getenv('GOOGLE_CLOUD_PROJECT', 'NOT SET')}")
-    print(f"  - VERTEX_ENDPOINT_ID: {os.getenv('VERTEX_ENDPOINT_ID', 'NOT SET')}")
-    print(f"  - VERTEX_LOCATION: {os.getenv('VERTEX_LOCATION', 'NOT SET')}")
-    print(f"  - GOOGLE_CREDENTIALS: {'SET' if os.getenv('GOOGLE_CREDENTIALS') else 'NOT SET'}")
-    print(f"  - GOOGLE_AUTH_AVAILABLE: {GOOGLE_AUTH_AVAILABLE}")
-    print(f"  - VERTEX_AI_ENABLED: {enabled}")
+    cloud_project = os.getenv('GOOGLE_CLOUD_PROJECT')
+    endpoint = os.getenv('VERTEX_ENDPOINT_ID')
+    vertex_location = os.getenv('VERTEX_LOCATION')
+    credentials = os.getenv('GOOGLE_CREDENTIALS')
+    enabled = all([cloud_project, endpoint, vertex_location, credentials])
+    
+    logger.debug("🔍 Runtime environment check:")
+    logger.debug("  - GOOGLE_CLOUD_PROJECT: %s", cloud_project or 'NOT SET')
+    logger.debug("  - VERTEX_ENDPOINT_ID: %s", endpoint or 'NOT SET')
+    logger.debug("  - VERTEX_LOCATION: %s", vertex_location or 'NOT SET')
+    logger.debug("  - GOOGLE_CREDENTIALS: %s", 'SET' if credentials else 'NOT SET')
+    logger.debug("  - GOOGLE_AUTH_AVAILABLE: %s", GOOGLE_AUTH_AVAILABLE)
+    logger.debug("  - VERTEX_AI_ENABLED: %s", enabled)
     
     return enabled
 
+# The environment doesn't change during the process lifetime, so resolve it once
+VERTEX_AI_ENABLED = check_vertex_ai_enabled()
+GOOGLE_CREDENTIALS_JSON = os.getenv('GOOGLE_CREDENTIALS')
+
 def compress_image(image_bytes, max_size_mb=0.8, quality=85):
     """
     Compress image to reduce file size while maintaining quality.
@@ -115,76 +205,127 @@ def compress_image(image_bytes, max_size_mb=0.8, quality=85):
         Compressed image bytes
     """
     try:
+        # Check current size before touching Pillow; small uploads are sent as-is
+        current_size_mb = len(image_bytes) / (1024 * 1024)
+        logger.debug("📏 Original image size: %.2f MB", current_size_mb)
+        
+        if current_size_mb <= max_size_mb:
+            logger.debug("✅ Image size OK (%.2f MB <= %s MB)", current_size_mb, max_size_mb)
+            return image_bytes
+        
         # Open image with Pillow
         image = Image.open(io.BytesIO(image_bytes))
         
         # Convert to RGB if necessary (for JPEG compatibility)
-        if image.mode in ('RGBA', 'LA', 'P'):
-            # Create white background for transparent images
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-            image = background
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        if image.mode == 'RGBA':
+            # Blend transparent images onto a white background in one pass
+            background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+            image = Image.alpha_composite(background, image).convert('RGB')
         elif image.mode != 'RGB':
             image = image.convert('RGB')
         
-        # Check current size
-        current_size_mb = len(image_bytes) / (1024 * 1024)
-        print(f"📏 Original image size: {current_size_mb:.2f} MB")
-        
-        if current_size_mb <= max_size_mb:
-            print(f"✅ Image size OK ({current_size_mb:.2f} MB <= {max_size_mb} MB)")
-            return image_bytes
-        
         # Compress the image
         output = io.BytesIO()
         
-        # Try different quality levels if needed
+        # Step down from the requested quality. Most oversize uploads fit at 75, so
+        # they cost two encodes; bisecting the range would spend more on that case
         for attempt_quality in [quality, 75, 65, 55, 45]:
             output.seek(0)
             output.truncate(0)
             
             image.save(output, format='JPEG', quality=attempt_quality, optimize=True)
-            compressed_size_mb = len(output.getvalue()) / (1024 * 1024)
+            compressed_size_mb = output.tell() / (1024 * 1024)
             
-            print(f"🔧 Compression attempt: quality={attempt_quality}, size={compressed_size_mb:.2f} MB")
+            logger.debug("🔧 Compression attempt: quality=%s, size=%.2f MB", attempt_quality, compressed_size_mb)
             
             if compressed_size_mb <= max_size_mb:
-                print(f"✅ Compression successful: {compressed_size_mb:.2f} MB (quality={attempt_quality})")
+                logger.debug("✅ Compression successful: %.2f MB (quality=%s)", compressed_size_mb, attempt_quality)
                 return output.getvalue()
         
         # If still too large, resize the image
-        print(f"⚠️ Still too large after compression, resizing image...")
+        logger.warning("⚠️ Still too large after compression, resizing image...")
         original_size = image.size
         scale_factor = 0.8
         
         while scale_factor > 0.3:  # Don't go below 30% of original size
             new_size = (int(original_size[0] * scale_factor), int(original_size[1] * scale_factor))
-            resized_image = image.resize(new_size, Image.Resampling.LANCZOS)
+            # Bilinear is plenty for a q75 JPEG; reducing_gap box-reduces first on big downscales
+            resized_image = image.resize(new_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
             
             output.seek(0)
             output.truncate(0)
             resized_image.save(output, format='JPEG', quality=75, optimize=True)
-            final_size_mb = len(output.getvalue()) / (1024 * 1024)
+            final_size_mb = output.tell() / (1024 * 1024)
             
-            print(f"🔧 Resize attempt: {new_size}, size={final_size_mb:.2f} MB")
+            logger.debug("🔧 Resize attempt: %s, size=%.2f MB", new_size, final_size_mb)
             
             if final_size_mb <= max_size_mb:
-                print(f"✅ Resize successful: {final_size_mb:.2f} MB (scale={scale_factor:.1f})")
+                logger.debug("✅ Resize successful: %.2f MB (scale=%.1f)", final_size_mb, scale_factor)
                 return output.getvalue()
             
             scale_factor -= 0.1
         
         # Last resort: return the smallest we could make it
-        print(f"⚠️ Using smallest possible size: {final_size_mb:.2f} MB")
+        logger.warning("⚠️ Using smallest possible size: %.2f MB", final_size_mb)
         return output.getvalue()
         
     except Exception as e:
-        print(f"❌ Error compressing image: {e}")
+        logger.error("❌ Error compressing image: %s", e)
         # Return original if compression fails
         return image_bytes
 
+# Recently encoded payloads keyed by a digest of the upload, so re-submitted
+# images (retries, running the other model afterwards) skip recompression
+_ENCODED_IMAGE_CACHE = OrderedDict()
+_ENCODED_IMAGE_CACHE_SIZE = 8
+_encoded_image_lock = threading.Lock()
+
+def encode_image_content(image_bytes):
+    """Compress and base64-encode an image for the Vertex AI "content" field.
+
+    Both models send the same payload image, so the result can be computed
+    once per upload and handed to each predict call.
+    """
+    key = hashlib.blake2b(image_bytes, digest_size=16).digest()
+    with _encoded_image_lock:
+        image_content = _ENCODED_IMAGE_CACHE.get(key)
+        if image_content is not None:
+            _ENCODED_IMAGE_CACHE.move_to_end(key)
+            logger.debug("✅ Using cached compressed image")
+            return image_content
+    
+    compressed_image_bytes = compress_image(image_bytes, max_size_mb=0.8)
+    logger.debug("  - Compressed image size: %s bytes", len(compressed_image_bytes))
+    image_content = base64.b64encode(compressed_image_bytes).decode('ascii')
+    
+    with _encoded_image_lock:
+        _ENCODED_IMAGE_CACHE[key] = image_content
+        if len(_ENCODED_IMAGE_CACHE) > _ENCODED_IMAGE_CACHE_SIZE:
+            _ENCODED_IMAGE_CACHE.popitem(last=False)
+    return image_content
+
+# Canonical class names ("2", "class2", "Class02"); anything else takes the slower int() path
+_CLASS_NAME_RE = re.compile(r'(class)?([0-9]+)', re.IGNORECASE | re.ASCII)
+# int() needs at least one decimal digit, so names without one ("weak", "class") can't parse
+_DIGIT_RE = re.compile(r'\d')
+
+def get_hair_count(class_name):
+    """Extract the hair count from a density class name ("1" -> 1, "class2" -> 2), defaulting to 1"""
+    try:
+        match = _CLASS_NAME_RE.fullmatch(class_name)
+        if match:
+            return int(match.group(2))
+        if not _DIGIT_RE.search(class_name):
+            return 1
+        if class_name.lower().startswith('class'):
+            return int(class_name.lower().replace('class', ''))
+        # Try to parse the class name directly as a number
+        return int(class_name)
+    except:
+        return 1
+
 def calculate_follicular_metrics(predictions):
     """
     Calculate follicular unit density and hair metrics based on known area.
@@ -204,6 +345,7 @@ def calculate_follicular_metrics(predictions):
     fu_with_one_hair = 0
     fu_with_multiple_hairs = 0
     class_counts = {}
+    class_numbers = {}
     
     for pred in predictions:
         class_name = pred.get('displayName', 'Unknown')
@@ -213,42 +355,23 @@ def calculate_follicular_metrics(predictions):
         if confidence < 0.1:  # Use same threshold as confidence filter
             continue
             
-        # Extract class number (e.g., "1" -> 1, "2" -> 2, "class1" -> 1, "class2" -> 2)
-        try:
-            if class_name.lower().startswith('class'):
-                class_number = int(class_name.lower().replace('class', ''))
-            else:
-                # Try to parse the class name directly as a number
-                class_number = int(class_name)
-        except:
-            class_number = 1
+        # Extract class number (e.g., "1" -> 1, "2" -> 2, "class1" -> 1, "class2" -> 2),
+        # parsing each distinct class name only once
+        if class_name in class_numbers:
+            class_number = class_numbers[class_name]
+        else:
+            class_number = class_numbers[class_name] = get_hair_count(class_name)
         
-        # Count follicular units and hairs
+        # Count follicular units and hairs, and the FU breakdown, in the same pass
         total_follicular_units += 1
         total_hairs += class_number
-        
-        # Track class distribution
-        if class_name not in class_counts:
-            class_counts[class_name] = 0
-        class_counts[class_name] += 1
-    
-    # Calculate FU breakdown from class counts
-    for class_name, count in class_counts.items():
-        try:
-            if class_name.lower().startswith('class'):
-                class_number = int(class_name.lower().replace('class', ''))
-            else:
-                # Try to parse the class name directly as a number
-                class_number = int(class_name)
-        except:
-            class_number = 1
-            
-
-            
         if class_number == 1:
-            fu_with_one_hair += count
+            fu_with_one_hair += 1
         else:
-            fu_with_multiple_hairs += count
+            fu_with_multiple_hairs += 1
+        
+        # Track class distribution
+        class_counts[class_name] = class_counts.get(class_name, 0) + 1
     
     # Calculate metrics
     follicular_density = total_follicular_units / AREA_CM2 if AREA_CM2 > 0 else 0
@@ -265,17 +388,26 @@ def calculate_follicular_metrics(predictions):
         'class_distribution': class_counts
     }
     
-    print(f"📊 Follicular Metrics:")
-    print(f"  - Total FU: {total_follicular_units}")
-    print(f"  - Total Hairs: {total_hairs}")
-    print(f"  - FU Density: {follicular_density:.2f} per cm²")
-    print(f"  - Avg Hairs/FU: {average_hair_per_unit:.2f}")
-    print(f"  - FU with 1 Hair: {fu_with_one_hair}")
-    print(f"  - FU with 2+ Hairs: {fu_with_multiple_hairs}")
+    logger.debug("📊 Follicular Metrics:")
+    logger.debug("  - Total FU: %s", total_follicular_units)
+    logger.debug("  - Total Hairs: %s", total_hairs)
+    logger.debug("  - FU Density: %.2f per cm²", follicular_density)
+    logger.debug("  - Avg Hairs/FU: %.2f", average_hair_per_unit)
+    logger.debug("  - FU with 1 Hair: %s", fu_with_one_hair)
+    logger.debug("  - FU with 2+ Hairs: %s", fu_with_multiple_hairs)
 
     
     return metrics
 
+def count_thickness_classes(predictions):
+    """Count strong/medium/weak thickness detections in a single pass over the predictions"""
+    counts = {'strong': 0, 'medium': 0, 'weak': 0}
+    for pred in predictions:
+        class_name = pred['displayName']
+        if class_name in counts:
+            counts[class_name] += 1
+    return counts
+
 def calculate_combined_metrics(density_predictions, thickness_predictions):
     """
     Calculate combined metrics from both density and thickness models.
@@ -306,9 +438,10 @@ def calculate_combined_metrics(density_predictions, thickness_predictions):
     
     # Calculate raw thickness metrics
     if thickness_predictions:
-        strong_hairs_raw = sum(1 for p in thickness_predictions if p['displayName'] == 'strong')
-        medium_hairs_raw = sum(1 for p in thickness_predictions if p['displayName'] == 'medium')
-        weak_hairs_raw = sum(1 for p in thickness_predictions if p['displayName'] == 'weak')
+        thickness_counts = count_thickness_classes(thickness_predictions)
+        strong_hairs_raw = thickness_counts['strong']
+        medium_hairs_raw = thickness_counts['medium']
+        weak_hairs_raw = thickness_counts['weak']
         total_thickness_detections_raw = len(thickness_predictions)
     else:
         strong_hairs_raw = 0
@@ -330,10 +463,10 @@ def calculate_combined_metrics(density_predictions, thickness_predictions):
         weak_hairs = weak_percentage * total_hairs
         total_thickness_detections = total_hairs  # Use density model count as ground truth
         
-        print(f"🔧 Scaling thickness results:")
-        print(f"  - Raw thickness detections: {total_thickness_detections_raw} (strong: {strong_hairs_raw}, medium: {medium_hairs_raw}, weak: {weak_hairs_raw})")
-        print(f"  - Density model hair count: {total_hairs}")
-        print(f"  - Scaled thickness: strong: {strong_hairs:.1f}, medium: {medium_hairs:.1f}, weak: {weak_hairs:.1f}")
+        logger.debug("🔧 Scaling thickness results:")
+        logger.debug("  - Raw thickness detections: %s (strong: %s, medium: %s, weak: %s)", total_thickness_detections_raw, strong_hairs_raw, medium_hairs_raw, weak_hairs_raw)
+        logger.debug("  - Density model hair count: %s", total_hairs)
+        logger.debug("  - Scaled thickness: strong: %.1f, medium: %.1f, weak: %.1f", strong_hairs, medium_hairs, weak_hairs)
     else:
         # Fallback if no thickness detections
         strong_hairs = 0
@@ -436,19 +569,19 @@ def calculate_combined_metrics(density_predictions, thickness_predictions):
     else:
         thick_hair_color = "danger"
     
-    print(f"📊 Combined Metrics (using density model hair count as ground truth):")
-    print(f"  - Terminal-to-Vellus Ratio (weak/strong): {terminal_to_vellus_ratio:.1f}%")
-    print(f"  - % Thick Hairs (strong/total): {percent_thick_hairs:.1f}%")
-    print(f"  - Hair Caliber Index: {hair_caliber_index}")
-    print(f"  - Hair Caliber Index %: {hair_caliber_index_percentage:.1f}%")
-    print(f"  - Average Thickness Score: {average_thickness_score:.2f}")
-    print(f"  - Hairs per FU: {hairs_per_fu:.2f}")
-    print(f"  - Hairs per cm²: {hairs_per_cm2:.1f}")
-    print(f"  - EHD = (hairs_per_cm² × avg_thickness_score) / 3: {effective_hair_density:.1f}")
-    print(f"  - EHD_max: {ehd_max}")
-    print(f"  - EHD% = (EHD / EHD_max) × 100: {ehd_percentage:.1f}%")
-    print(f"  - Overall Hair Score (OHS) - Harmonic Mean: {overall_hair_score:.1f}% ({ohs_interpretation})")
-    print(f"  - Final thickness breakdown: {strong_hairs:.1f} strong, {medium_hairs:.1f} medium, {weak_hairs:.1f} weak")
+    logger.debug("📊 Combined Metrics (using density model hair count as ground truth):")
+    logger.debug("  - Terminal-to-Vellus Ratio (weak/strong): %.1f%%", terminal_to_vellus_ratio)
+    logger.debug("  - %% Thick Hairs (strong/total): %.1f%%", percent_thick_hairs)
+    logger.debug("  - Hair Caliber Index: %s", hair_caliber_index)
+    logger.debug("  - Hair Caliber Index %%: %.1f%%", hair_caliber_index_percentage)
+    logger.debug("  - Average Thickness Score: %.2f", average_thickness_score)
+    logger.debug("  - Hairs per FU: %.2f", hairs_per_fu)
+    logger.debug("  - Hairs per cm²: %.1f", hairs_per_cm2)
+    logger.debug("  - EHD = (hairs_per_cm² × avg_thickness_score) / 3: %.1f", effective_hair_density)
+    logger.debug("  - EHD_max: %s", ehd_max)
+    logger.debug("  - EHD%% = (EHD / EHD_max) × 100: %.1f%%", ehd_percentage)
+    logger.debug("  - Overall Hair Score (OHS) - Harmonic Mean: %.1f%% (%s)", overall_hair_score, ohs_interpretation)
+    logger.debug("  - Final thickness breakdown: %.1f strong, %.1f medium, %.1f weak", strong_hairs, medium_hairs, weak_hairs)
     
     return {
         'terminal_to_vellus_ratio': round(terminal_to_vellus_ratio, 1),  # Percentage, 1 decimal
@@ -472,7 +605,7 @@ def calculate_combined_metrics(density_predictions, thickness_predictions):
 
 def get_mock_predictions():
     """Return empty predictions when Vertex AI is not available - no mock data"""
-    print("⚠️ Returning empty predictions - Vertex AI not available")
+    logger.warning("⚠️ Returning empty predictions - Vertex AI not available")
     return []
 
 # JWT token creation removed - now using Google Auth library for better performance
@@ -481,60 +614,95 @@ def get_mock_predictions():
 _access_token_cache = None
 _access_token_expiry = 0
 
+# Parsed service account credentials, reused across token refreshes
+_credentials = None
+_credentials_source = None
+
+# Refresh this long before Google's reported expiry
+TOKEN_EXPIRY_MARGIN_SECONDS = 5 * 60
+
+# Serializes token refreshes so concurrent requests don't each sign a new JWT
+_token_lock = threading.Lock()
+
+def get_service_account_credentials(credentials_json):
+    """Parse the service account JSON once and keep the Credentials object"""
+    global _credentials, _credentials_source
+    
+    if _credentials is None or credentials_json != _credentials_source:
+        credentials_info = json.loads(credentials_json)
+        _credentials = service_account.Credentials.from_service_account_info(
+            credentials_info,
+            scopes=['https://www.googleapis.com/auth/cloud-platform']
+        )
+        _credentials_source = credentials_json
+    
+    return _credentials
+
 def get_google_access_token(credentials_json):
     """Get Google access token with caching for performance"""
     if not GOOGLE_AUTH_AVAILABLE:
-        print("❌ Google Auth library not available")
+        logger.error("❌ Google Auth library not available")
         return None
         
     global _access_token_cache, _access_token_expiry
     
     # Check if we have a valid cached token (tokens typically last 1 hour)
-    current_time = time.time()
-    if _access_token_cache and current_time < _access_token_expiry:
-        print("✅ Using cached access token")
+    if _access_token_cache and time.time() < _access_token_expiry:
+        logger.debug("✅ Using cached access token")
         return _access_token_cache
     
     try:
-        print("🔄 Generating new access token...")
-        
-        # Parse the service account credentials
-        credentials_info = json.loads(credentials_json)
-        
-        # Create credentials object
-        credentials = service_account.Credentials.from_service_account_info(
-            credentials_info,
-            scopes=['https://www.googleapis.com/auth/cloud-platform']
-        )
-        
-        # Get the access token
-        credentials.refresh(Request())
-        access_token = credentials.token
-        
-        # Cache the token with expiry (set to 50 minutes to be safe)
-        _access_token_cache = access_token
-        _access_token_expiry = current_time + (50 * 60)  # 50 minutes
-        
-        print("✅ New access token generated and cached")
-        return access_token
+        with _token_lock:
+            # Another thread may have refreshed the token while we waited
+            current_time = time.time()
+            if _access_token_cache and current_time < _access_token_expiry:
+                logger.debug("✅ Using cached access token")
+                return _access_token_cache
+            
+            logger.debug("🔄 Generating new access token...")
+            
+            # Refresh the cached credentials object in place
+            credentials = get_service_account_credentials(credentials_json)
+            credentials.refresh(_AUTH_REQUEST)
+            access_token = credentials.token
+            
+            # Cache the token until shortly before its real expiry (naive UTC datetime),
+            # falling back to 50 minutes if the library didn't report one
+            if credentials.expiry is not None:
+                expiry = credentials.expiry.replace(tzinfo=timezone.utc).timestamp()
+            else:
+                expiry = current_time + (55 * 60)
+            _access_token_cache = access_token
+            _access_token_expiry = expiry - TOKEN_EXPIRY_MARGIN_SECONDS
+            
+            logger.debug("✅ New access token generated and cached")
+            return access_token
         
     except Exception as e:
-        print(f"❌ Error getting access token: {e}")
+        logger.error("❌ Error getting access token: %s", e)
         return None
 
-def call_vertex_ai_endpoint(image_bytes, confidence_threshold, iou_threshold, max_predictions, access_token):
+@lru_cache(maxsize=1)
+def get_vertex_ai_headers(access_token):
+    """Request headers for a Vertex AI call, built once per access token (treat as read-only)"""
+    return {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
+
+def call_vertex_ai_endpoint(image_content, confidence_threshold, iou_threshold, max_predictions, access_token):
     """Make actual API call to Vertex AI endpoint"""
     try:
-        print("🚀 Making API call to Vertex AI endpoint...")
+        logger.debug("🚀 Making API call to Vertex AI endpoint...")
         
         # Construct the Vertex AI endpoint URL
         endpoint_url = f"https://{location}-aiplatform.googleapis.com/v1/projects/{project_id}/locations/{location}/endpoints/{endpoint_id}:predict"
-        print(f"  - Endpoint URL: {endpoint_url}")
+        logger.debug("  - Endpoint URL: %s", endpoint_url)
         
         # Prepare the request payload - using correct Vertex AI format
         payload = {
             "instances": [{
-                "content": base64.b64encode(image_bytes).decode('utf-8')
+                "content": image_content
             }],
             "parameters": {
                 "confidenceThreshold": confidence_threshold,
@@ -543,71 +711,55 @@ def call_vertex_ai_endpoint(image_bytes, confidence_threshold, iou_threshold, ma
             }
         }
         
-        print(f"  - Payload: {json.dumps(payload, indent=2)}")
+        logger.debug("  - Parameters: %s", payload['parameters'])
         
         # Set up headers with authorization
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
-        print(f"  - Headers: {json.dumps(headers, indent=2)}")
+        headers = get_vertex_ai_headers(access_token)
         
         # Make the actual API call
-        response = requests.post(
+        response = _SESSION.post(
             endpoint_url,
-            json=payload,
+            data=dumps_json_bytes(payload),
             headers=headers,
             timeout=30
         )
         
-        print(f"  - Response status: {response.status_code}")
-        print(f"  - Response headers: {dict(response.headers)}")
+        logger.debug("  - Response status: %s", response.status_code)
+        logger.debug("  - Response headers: %s", response.headers)
         
         if response.status_code == 200:
-                print("✅ Vertex AI API call successful")
-                result = response.json()
+                logger.debug("✅ Vertex AI API call successful")
+                result = loads_json(response.content)
                 
-                # Log the COMPLETE response for debugging
-                print("=" * 80)
-                print("🔍 COMPLETE VERTEX AI RESPONSE:")
-                print("=" * 80)
-                print(json.dumps(result, indent=2))
-                print("=" * 80)
+                # Log the COMPLETE response for debugging (only serialized when DEBUG is on)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("🔍 COMPLETE VERTEX AI RESPONSE:\n%s", json.dumps(result, indent=2))
                 
                 # Parse the predictions from the response
                 predictions = []
                 if 'predictions' in result and result['predictions']:
                     # Vertex AI returns predictions in a specific format
                     vertex_predictions = result['predictions'][0]
-                    print(f"🔍 Raw Vertex AI predictions[0]: {json.dumps(vertex_predictions, indent=2)}")
                     
                     # Check if this is the array-based format (bboxes, confidences, displayNames)
                     if isinstance(vertex_predictions, dict) and 'bboxes' in vertex_predictions:
-                        print(f"📋 Found array-based format with {len(vertex_predictions['bboxes'])} predictions")
+                        logger.debug("📋 Found array-based format with %s predictions", len(vertex_predictions['bboxes']))
                         
                         bboxes = vertex_predictions.get('bboxes', [])
                         confidences = vertex_predictions.get('confidences', [])
                         display_names = vertex_predictions.get('displayNames', [])
                         
-                        # Ensure all arrays have the same length
-                        min_length = min(len(bboxes), len(confidences), len(display_names))
-                        print(f"📏 Processing {min_length} predictions")
-                        
-                        for i in range(min_length):
-                            prediction = {
-                                'displayName': display_names[i] if i < len(display_names) else 'Unknown',
-                                'confidence': confidences[i] if i < len(confidences) else 0.0,
-                                'bbox': bboxes[i] if i < len(bboxes) else [0, 0, 0, 0]
-                            }
-                            print(f"✅ Parsed prediction {i}: {json.dumps(prediction, indent=2)}")
-                            predictions.append(prediction)
+                        # zip stops at the shortest array, so mismatched lengths are dropped
+                        predictions = [
+                            {'displayName': display_name, 'confidence': confidence, 'bbox': bbox}
+                            for display_name, confidence, bbox in zip(display_names, confidences, bboxes)
+                        ]
+                        logger.debug("📏 Processed %s predictions", len(predictions))
                     
                     # Handle different possible response formats
                     elif isinstance(vertex_predictions, list):
-                        print(f"📋 Predictions is a list with {len(vertex_predictions)} items")
+                        logger.debug("📋 Predictions is a list with %s items", len(vertex_predictions))
                         for i, pred in enumerate(vertex_predictions):
-                            print(f"🔍 Processing prediction {i}: {json.dumps(pred, indent=2)}")
                             if isinstance(pred, dict):
                                 # Extract prediction data
                                 prediction = {
@@ -615,11 +767,10 @@ def call_vertex_ai_endpoint(image_bytes, confidence_threshold, iou_threshold, ma
                                     'confidence': pred.get('confidence', pred.get('score', 0.0)),
                                     'bbox': pred.get('bbox', pred.get('boundingBox', [0, 0, 0, 0]))
                                 }
-                                print(f"✅ Parsed prediction {i}: {json.dumps(prediction, indent=2)}")
                                 predictions.append(prediction)
                             else:
                                 # Handle object format
-                                print(f"⚠️ Prediction {i} is not a dict: {type(pred)}")
+                                logger.warning("⚠️ Prediction %d is not a dict: %s", i, type(pred))
                                 predictions.append({
                                     'displayName': getattr(pred, 'displayName', getattr(pred, 'class', 'Unknown')),
                                     'confidence': getattr(pred, 'confidence', getattr(pred, 'score', 0.0)),
@@ -627,75 +778,62 @@ def call_vertex_ai_endpoint(image_bytes, confidence_threshold, iou_threshold, ma
                                 })
                     else:
                         # Single prediction or different format
-                        print(f"⚠️ Unexpected prediction format: {type(vertex_predictions)}")
-                        print(f"🔍 Content: {json.dumps(vertex_predictions, indent=2)}")
+                        logger.warning("⚠️ Unexpected prediction format: %s", type(vertex_predictions))
+                        logger.warning("🔍 Content: %s", vertex_predictions)
                         predictions.append({
                             'displayName': 'Unknown',
                             'confidence': 0.0,
                             'bbox': [0, 0, 0, 0]
                         })
                 else:
-                    print("⚠️ No 'predictions' key found in response")
-                    print(f"🔍 Available keys: {list(result.keys())}")
+                    logger.warning("⚠️ No 'predictions' key found in response")
+                    logger.warning("🔍 Available keys: %s", list(result.keys()))
                 
-                print(f"🎯 Final parsed {len(predictions)} predictions: {json.dumps(predictions, indent=2)}")
+                logger.debug("🎯 Final parsed %d predictions", len(predictions))
                 return predictions
         else:
-            print(f"❌ Vertex AI API call failed: {response.status_code}")
-            print(f"📄 Response: {response.text}")
+            logger.error("❌ Vertex AI API call failed: %s", response.status_code)
+            logger.error("📄 Response: %s", response.text)
             return None
             
     except Exception as e:
-        print(f"❌ Error calling Vertex AI endpoint: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error calling Vertex AI endpoint: %s", e)
         return None
 
-def predict_image_object_detection_rest(image_bytes, confidence_threshold, iou_threshold, padding_factor, max_predictions):
+def predict_image_object_detection_rest(image_bytes, confidence_threshold, iou_threshold, padding_factor, max_predictions, image_content=None):
     """Call Vertex AI endpoint using REST API (lightweight approach)"""
-    print(f"\n🔍 Starting Vertex AI prediction process...")
-    print(f"  - Original image size: {len(image_bytes)} bytes")
-    print(f"  - Confidence threshold: {confidence_threshold}")
-    print(f"  - NMS threshold: {iou_threshold}")
-    print(f"  - Padding factor: {padding_factor}")
-    print(f"  - Max predictions: {max_predictions}")
-    
-    # Compress image if it's too large for Vertex AI
-    compressed_image_bytes = compress_image(image_bytes, max_size_mb=0.8)
-    print(f"  - Compressed image size: {len(compressed_image_bytes)} bytes")
-    
-    # Check Vertex AI configuration at runtime (only once)
-    vertex_ai_enabled = check_vertex_ai_enabled()
-    
-    if not vertex_ai_enabled:
-        print("⚠️ Vertex AI not configured, using mock data")
-        print("  - Missing environment variables")
+    logger.debug("\n🔍 Starting Vertex AI prediction process...")
+    logger.debug("  - Original image size: %s bytes", len(image_bytes))
+    logger.debug("  - Confidence threshold: %s", confidence_threshold)
+    logger.debug("  - NMS threshold: %s", iou_threshold)
+    logger.debug("  - Padding factor: %s", padding_factor)
+    logger.debug("  - Max predictions: %s", max_predictions)
+    
+    # Vertex AI configuration is resolved once at startup
+    if not VERTEX_AI_ENABLED:
+        logger.warning("⚠️ Vertex AI not configured, using mock data")
+        logger.warning("  - Missing environment variables")
         return get_mock_predictions()
     
+    # Compress and encode the image for Vertex AI unless the caller already did
+    if image_content is None:
+        image_content = encode_image_content(image_bytes)
+    
     try:
-        print("🔍 Vertex AI configured - attempting real API call")
-        
-        # Get the service account credentials from environment
-        credentials_json = os.getenv('GOOGLE_CREDENTIALS')
-        if not credentials_json:
-            print("❌ No credentials found in environment")
-            return get_mock_predictions()
-        
-        print("✅ Credentials found in environment")
-        print(f"  - Credentials length: {len(credentials_json)} characters")
+        logger.debug("🔍 Vertex AI configured - attempting real API call")
         
         # Get access token (this is the main performance bottleneck)
-        access_token = get_google_access_token(credentials_json)
+        access_token = get_google_access_token(GOOGLE_CREDENTIALS_JSON)
         if not access_token:
-            print("❌ Failed to get access token")
+            logger.error("❌ Failed to get access token")
             return get_mock_predictions()
         
-        print("✅ Access token obtained")
+        logger.debug("✅ Access token obtained")
         
         # Make actual API call to Vertex AI with high IoU threshold to get all raw detections
         # We'll apply our own NMS later
         predictions = call_vertex_ai_endpoint(
-            compressed_image_bytes,  # Use compressed image
+            image_content,  # Use compressed, base64-encoded image
             confidence_threshold, 
             0.99,  # Very high IoU threshold to get all raw detections
             200,   # High max predictions to get all detections
@@ -703,47 +841,46 @@ def predict_image_object_detection_rest(image_bytes, confidence_threshold, iou_t
         )
         
         if predictions:
-            print("🎉 Real Vertex AI predictions received!")
-            print(f"  - Number of raw predictions: {len(predictions)}")
-            for i, pred in enumerate(predictions):
-                print(f"    {i+1}. {pred.get('displayName', 'Unknown')} - {pred.get('confidence', 0.0):.3f}")
+            logger.debug("🎉 Real Vertex AI predictions received!")
+            logger.debug("  - Number of raw predictions: %s", len(predictions))
+            if logger.isEnabledFor(logging.DEBUG):
+                for i, pred in enumerate(predictions):
+                    logger.debug("    %d. %s - %.3f", i + 1, pred.get('displayName', 'Unknown'), pred.get('confidence', 0.0))
             
             # Apply our own NMS to filter overlapping detections
             filtered_predictions = apply_nms(predictions, iou_threshold, padding_factor, max_predictions)
-            print(f"  - Number of predictions after NMS: {len(filtered_predictions)}")
+            logger.debug("  - Number of predictions after NMS: %s", len(filtered_predictions))
             return filtered_predictions
         else:
-            print("⚠️ Vertex AI call failed, falling back to mock data")
+            logger.warning("⚠️ Vertex AI call failed, falling back to mock data")
             return get_mock_predictions()
         
     except Exception as e:
-        print(f"❌ Error calling Vertex AI: {e}")
-        import traceback
-        traceback.print_exc()
-        print("🔄 Falling back to mock data")
+        logger.exception("❌ Error calling Vertex AI: %s", e)
+        logger.warning("🔄 Falling back to mock data")
         return get_mock_predictions()
 
-def predict_image_object_detection(image_bytes, confidence_threshold, iou_threshold, padding_factor, max_predictions):
+def predict_image_object_detection(image_bytes, confidence_threshold, iou_threshold, padding_factor, max_predictions, image_content=None):
     """Main prediction function - optimized to reduce redundant calls"""
     # Single call to the REST function - no more redundant calls
     return predict_image_object_detection_rest(
-        image_bytes, confidence_threshold, iou_threshold, padding_factor, max_predictions
+        image_bytes, confidence_threshold, iou_threshold, padding_factor, max_predictions, image_content
     )
 
-def call_thickness_vertex_ai_endpoint(image_bytes, confidence_threshold, iou_threshold, max_predictions, access_token):
+def call_thickness_vertex_ai_endpoint(image_content, confidence_threshold, iou_threshold, max_predictions, access_token):
     """Make actual API call to Thickness Vertex AI endpoint - SAME AS DENSITY MODEL"""
     try:
-        print("🚀 Making API call to Thickness Vertex AI endpoint...")
+        logger.debug("🚀 Making API call to Thickness Vertex AI endpoint...")
         
         # Construct the Thickness Vertex AI endpoint URL - ONLY DIFFERENCE FROM DENSITY MODEL
         endpoint_url = f"https://{thickness_location}-aiplatform.googleapis.com/v1/projects/{thickness_project_id}/locations/{thickness_location}/endpoints/{thickness_endpoint_id}:predict"
-        print(f"  - Thickness Endpoint URL: {endpoint_url}")
+        logger.debug("  - Thickness Endpoint URL: %s", endpoint_url)
         
         # Prepare the request payload - EXACT SAME AS DENSITY MODEL
         payload = {
             "instances": [
                 {
-                    "content": base64.b64encode(image_bytes).decode('utf-8')
+                    "content": image_content
                 }
             ],
             "parameters": {
@@ -754,40 +891,28 @@ def call_thickness_vertex_ai_endpoint(image_bytes, confidence_threshold, iou_thr
         }
         
         # Make the API request - EXACT SAME AS DENSITY MODEL
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
+        headers = get_vertex_ai_headers(access_token)
         
-        print(f"  - Making request with confidence: {confidence_threshold}, max: {max_predictions}, IoU: {iou_threshold}")
+        logger.debug("  - Making request with confidence: %s, max: %s, IoU: %s", confidence_threshold, max_predictions, iou_threshold)
         
         # Log the exact API call being made
-        print(f"🔍 EXACT API CALL DETAILS:")
-        print(f"  - URL: {endpoint_url}")
-        print(f"  - Method: POST")
-        print(f"  - Headers: {headers}")
-        print(f"  - Payload: {payload}")
-        
-        # Generate curl command for debugging
-        curl_command = f"""curl -X POST '{endpoint_url}' \\
-  -H 'Authorization: Bearer {access_token}' \\
-  -H 'Content-Type: application/json' \\
-  -d '{json.dumps(payload)}'"""
-        print(f"🔍 CURL COMMAND:")
-        print(curl_command)
-        
-        response = requests.post(endpoint_url, json=payload, headers=headers, timeout=30)
+        logger.debug("🔍 EXACT API CALL DETAILS:")
+        logger.debug("  - URL: %s", endpoint_url)
+        logger.debug("  - Method: POST")
+        logger.debug("  - Parameters: %s", payload['parameters'])
+        
+        response = _SESSION.post(endpoint_url, data=dumps_json_bytes(payload), headers=headers, timeout=30)
         
         # Log response details
-        print(f"🔍 API RESPONSE DETAILS:")
-        print(f"  - Status Code: {response.status_code}")
-        print(f"  - Response Headers: {dict(response.headers)}")
-        print(f"  - Response Text: {response.text}")
+        logger.debug("🔍 API RESPONSE DETAILS:")
+        logger.debug("  - Status Code: %s", response.status_code)
+        logger.debug("  - Response Headers: %s", response.headers)
         
         if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Thickness Vertex AI API call successful")
-            print(f"  - Full Response JSON: {json.dumps(result, indent=2)}")
+            result = loads_json(response.content)
+            logger.debug("✅ Thickness Vertex AI API call successful")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("  - Full Response JSON: %s", json.dumps(result, indent=2))
             
             # Parse predictions from response - THICKNESS MODEL FORMAT
             predictions = []
@@ -800,13 +925,11 @@ def call_thickness_vertex_ai_endpoint(image_bytes, confidence_threshold, iou_thr
                         confidences = pred['confidences']
                         
                         # Combine the arrays into individual predictions
-                        for i in range(len(display_names)):
-                            if confidences[i] >= confidence_threshold:
-                                predictions.append({
-                                    'displayName': display_names[i],
-                                    'confidence': confidences[i],
-                                    'bbox': bboxes[i]
-                                })
+                        predictions.extend(
+                            {'displayName': display_name, 'confidence': confidence, 'bbox': bbox}
+                            for display_name, confidence, bbox in zip(display_names, confidences, bboxes)
+                            if confidence >= confidence_threshold
+                        )
                     # Fallback to density model format if needed
                     elif 'detections' in pred:
                         for detection in pred['detections']:
@@ -817,64 +940,51 @@ def call_thickness_vertex_ai_endpoint(image_bytes, confidence_threshold, iou_thr
                                     'bbox': detection.get('bbox', [0, 0, 0, 0])
                                 })
             
-            print(f"  - Raw thickness predictions: {len(predictions)}")
+            logger.debug("  - Raw thickness predictions: %s", len(predictions))
             return predictions
             
         else:
-            print(f"❌ Thickness Vertex AI API error: {response.status_code}")
-            print(f"  - Response: {response.text}")
+            logger.error("❌ Thickness Vertex AI API error: %s", response.status_code)
+            logger.error("  - Response: %s", response.text)
             return []
             
     except Exception as e:
-        print(f"❌ Error calling thickness Vertex AI endpoint: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error calling thickness Vertex AI endpoint: %s", e)
         return []
 
-def predict_thickness_model_rest(image_bytes, confidence_threshold, iou_threshold, padding_factor, max_predictions):
+def predict_thickness_model_rest(image_bytes, confidence_threshold, iou_threshold, padding_factor, max_predictions, image_content=None):
     """Call Thickness Vertex AI endpoint using REST API - EXACT SAME AS DENSITY MODEL"""
-    print(f"\n🔍 Starting Thickness Vertex AI prediction process...")
-    print(f"  - Original image size: {len(image_bytes)} bytes")
-    print(f"  - Confidence threshold: {confidence_threshold}")
-    print(f"  - NMS threshold: {iou_threshold}")
-    print(f"  - Padding factor: {padding_factor}")
-    print(f"  - Max predictions: {max_predictions}")
-    
-    # Compress image if it's too large for Vertex AI - SAME AS DENSITY MODEL
-    compressed_image_bytes = compress_image(image_bytes, max_size_mb=0.8)
-    print(f"  - Compressed image size: {len(compressed_image_bytes)} bytes")
-    
-    # Check Vertex AI configuration at runtime - SAME AS DENSITY MODEL
-    vertex_ai_enabled = check_vertex_ai_enabled()
-    
-    if not vertex_ai_enabled:
-        print("⚠️ Vertex AI not configured, using mock data for thickness model")
-        print("  - Missing environment variables")
+    logger.debug("\n🔍 Starting Thickness Vertex AI prediction process...")
+    logger.debug("  - Original image size: %s bytes", len(image_bytes))
+    logger.debug("  - Confidence threshold: %s", confidence_threshold)
+    logger.debug("  - NMS threshold: %s", iou_threshold)
+    logger.debug("  - Padding factor: %s", padding_factor)
+    logger.debug("  - Max predictions: %s", max_predictions)
+    
+    # Vertex AI configuration is resolved once at startup - SAME AS DENSITY MODEL
+    if not VERTEX_AI_ENABLED:
+        logger.warning("⚠️ Vertex AI not configured, using mock data for thickness model")
+        logger.warning("  - Missing environment variables")
         return get_mock_thickness_predictions()
     
+    # Compress and encode the image for Vertex AI unless the caller already did - SAME AS DENSITY MODEL
+    if image_content is None:
+        image_content = encode_image_content(image_bytes)
+    
     try:
-        print("🔍 Vertex AI configured - attempting real API call for thickness model")
-        
-        # Get the service account credentials from environment - SAME AS DENSITY MODEL
-        credentials_json = os.getenv('GOOGLE_CREDENTIALS')
-        if not credentials_json:
-            print("❌ No credentials found in environment")
-            return get_mock_thickness_predictions()
-        
-        print("✅ Credentials found in environment")
-        print(f"  - Credentials length: {len(credentials_json)} characters")
+        logger.debug("🔍 Vertex AI configured - attempting real API call for thickness model")
         
         # Get access token - SAME AS DENSITY MODEL
-        access_token = get_google_access_token(credentials_json)
+        access_token = get_google_access_token(GOOGLE_CREDENTIALS_JSON)
         if not access_token:
-            print("❌ Failed to get access token")
+            logger.error("❌ Failed to get access token")
             return get_mock_thickness_predictions()
         
-        print("✅ Access token obtained for thickness model")
+        logger.debug("✅ Access token obtained for thickness model")
         
         # Make actual API call to Thickness Vertex AI - SAME AS DENSITY MODEL
         predictions = call_thickness_vertex_ai_endpoint(
-            compressed_image_bytes,  # Use compressed image
+            image_content,  # Use compressed, base64-encoded image
             confidence_threshold, 
             0.99,  # Very high IoU threshold to get all raw detections
             200,   # High max predictions to get all detections
@@ -882,24 +992,23 @@ def predict_thickness_model_rest(image_bytes, confidence_threshold, iou_threshol
         )
         
         if predictions:
-            print("🎉 Real Thickness Vertex AI predictions received!")
-            print(f"  - Number of raw predictions: {len(predictions)}")
-            for i, pred in enumerate(predictions):
-                print(f"    {i+1}. {pred.get('displayName', 'Unknown')} - {pred.get('confidence', 0.0):.3f}")
+            logger.debug("🎉 Real Thickness Vertex AI predictions received!")
+            logger.debug("  - Number of raw predictions: %s", len(predictions))
+            if logger.isEnabledFor(logging.DEBUG):
+                for i, pred in enumerate(predictions):
+                    logger.debug("    %d. %s - %.3f", i + 1, pred.get('displayName', 'Unknown'), pred.get('confidence', 0.0))
             
             # Apply our own NMS to filter overlapping detections - SAME AS DENSITY MODEL
             filtered_predictions = apply_nms(predictions, iou_threshold, padding_factor, max_predictions)
-            print(f"  - Number of predictions after NMS: {len(filtered_predictions)}")
+            logger.debug("  - Number of predictions after NMS: %s", len(filtered_predictions))
             return filtered_predictions
         else:
-            print("⚠️ Thickness Vertex AI call failed, falling back to mock data")
+            logger.warning("⚠️ Thickness Vertex AI call failed, falling back to mock data")
             return get_mock_thickness_predictions()
         
     except Exception as e:
-        print(f"❌ Error calling Thickness Vertex AI: {e}")
-        import traceback
-        traceback.print_exc()
-        print("🔄 Falling back to mock data for thickness model")
+        logger.exception("❌ Error calling Thickness Vertex AI: %s", e)
+        logger.warning("🔄 Falling back to mock data for thickness model")
         return get_mock_thickness_predictions()
 
 def get_mock_thickness_predictions():
@@ -910,205 +1019,65 @@ def get_mock_thickness_predictions():
         {'displayName': 'weak', 'confidence': 0.78, 'bbox': [0.6, 0.8, 0.2, 0.5]}
     ]
 
-def create_combined_annotated_image(image_bytes, density_predictions, thickness_predictions, density_padding_factor, thickness_padding_factor):
-    """Create a single image with both density and thickness overlays"""
+def create_combined_annotated_image(density_image, thickness_image, thickness_mask):
+    """
+    Create a single image with both density and thickness overlays.
+    
+    Composites the already-annotated per-model images instead of decoding and
+    redrawing every box again: pixels in thickness_mask (recorded by annotate_image
+    while drawing the thickness overlay) are taken from the thickness image,
+    everything else from the density image.
+    """
     try:
-        print("🎨 Creating combined annotated image...")
-        
-        # Load the original image
-        image = Image.open(io.BytesIO(image_bytes))
-        draw = ImageDraw.Draw(image)
-        
-        # Get image dimensions
-        img_width, img_height = image.size
-        print(f"  - Image dimensions: {img_width}x{img_height}")
-        
-        # Try to load a font
-        try:
-            # Try different font paths for different platforms
-            font_paths = [
-                "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-                "/System/Library/Fonts/Arial.ttf",
-                "C:/Windows/Fonts/arial.ttf",
-                "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf"
-            ]
-            
-            font = None
-            for font_path in font_paths:
-                try:
-                    font = ImageFont.truetype(font_path, 16)
-                    print(f"  - Using font: {font_path}")
-                    break
-                except:
-                    continue
-            
-            if font is None:
-                font = ImageFont.load_default()
-                print("  - Using default font")
-                
-        except Exception as e:
-            print(f"  - Font loading error: {e}")
-            font = ImageFont.load_default()
-        
-        # Draw density predictions with consistent colors
-        if density_predictions:
-            print(f"  - Drawing {len(density_predictions)} density predictions with padding {density_padding_factor}")
-            for pred in density_predictions:
-                bbox = pred.get('bbox', [])
-                if len(bbox) == 4:
-                    # Apply density-specific padding to bounding box
-                    padded_bbox = apply_padding_to_bbox(bbox, density_padding_factor)
-                    
-                    # Convert normalized coordinates to absolute pixels
-                    x_min = int(padded_bbox[0] * img_width)
-                    y_min = int(padded_bbox[2] * img_height)
-                    x_max = int(padded_bbox[1] * img_width)
-                    y_max = int(padded_bbox[3] * img_height)
-                    
-                    # Get class-specific color: 1=blue, 2=white
-                    class_name = pred.get('displayName', 'Unknown')
-                    if class_name == '1':
-                        color = 'blue'
-                    elif class_name == '2':
-                        color = 'white'
-                    else:
-                        color = 'blue'  # default
-                    
-                    # Draw rectangle for density
-                    draw.rectangle([x_min, y_min, x_max, y_max], outline=color, width=2)
-                    
-                    # Add label
-                    confidence = pred.get('confidence', 0.0)
-                    label = f"{class_name}: {confidence:.2f}"
-                    
-                    # Draw label background
-                    bbox_text = draw.textbbox((x_min, y_min - 20), label, font=font)
-                    draw.rectangle(bbox_text, fill=color)
-                    draw.text((x_min, y_min - 20), label, fill='black' if color == 'white' else 'white', font=font)
-        
-        # Draw thickness predictions with consistent colors
-        if thickness_predictions:
-            print(f"  - Drawing {len(thickness_predictions)} thickness predictions with padding {thickness_padding_factor}")
-            for pred in thickness_predictions:
-                bbox = pred.get('bbox', [])
-                if len(bbox) == 4:
-                    # Apply thickness-specific padding to bounding box
-                    padded_bbox = apply_padding_to_bbox(bbox, thickness_padding_factor)
-                    
-                    # Convert normalized coordinates to absolute pixels
-                    x_min = int(padded_bbox[0] * img_width)
-                    y_min = int(padded_bbox[2] * img_height)
-                    x_max = int(padded_bbox[1] * img_width)
-                    y_max = int(padded_bbox[3] * img_height)
-                    
-                    # Get class-specific color: weak=red, medium=yellow, strong=green
-                    class_name = pred.get('displayName', 'Unknown')
-                    if class_name == 'weak':
-                        color = 'red'
-                    elif class_name == 'medium':
-                        color = 'yellow'
-                    elif class_name == 'strong':
-                        color = 'green'
-                    else:
-                        color = 'green'  # default
-                    
-                    # Draw rectangle for thickness
-                    draw.rectangle([x_min, y_min, x_max, y_max], outline=color, width=2)
-                    
-                    # Add label
-                    confidence = pred.get('confidence', 0.0)
-                    label = f"{class_name}: {confidence:.2f}"
-                    
-                    # Draw label background
-                    bbox_text = draw.textbbox((x_min, y_min - 20), label, font=font)
-                    draw.rectangle(bbox_text, fill=color)
-                    draw.text((x_min, y_min - 20), label, fill='black' if color == 'yellow' else 'white', font=font)
-        
-        # Convert to base64
-        img_buffer = io.BytesIO()
-        image.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
+        logger.debug("🎨 Creating combined annotated image...")
         
-        # Encode as base64
-        img_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
-        data_url = f"data:image/png;base64,{img_base64}"
+        combined_image = Image.composite(thickness_image, density_image, thickness_mask)
+        data_url = image_to_data_url(combined_image)
         
-        print("✅ Combined annotated image created successfully")
+        logger.debug("✅ Combined annotated image created successfully")
         return data_url
         
     except Exception as e:
-        print(f"❌ Error creating combined annotated image: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error creating combined annotated image: %s", e)
         return None
 
-def calculate_iou(box1, box2):
-    """
-    Calculate Intersection over Union (IoU) of two bounding boxes.
-    Boxes are in format [xMin, xMax, yMin, yMax] (normalized coordinates).
-    """
-    # Extract coordinates
-    x1_min, x1_max, y1_min, y1_max = box1
-    x2_min, x2_max, y2_min, y2_max = box2
-    
-    # Calculate intersection area
-    x_left = max(x1_min, x2_min)
-    y_top = max(y1_min, y2_min)
-    x_right = min(x1_max, x2_max)
-    y_bottom = min(y1_max, y2_max)
-    
-    if x_right < x_left or y_bottom < y_top:
-        return 0.0
-    
-    intersection_area = (x_right - x_left) * (y_bottom - y_top)
-    
-    # Calculate union area
-    box1_area = (x1_max - x1_min) * (y1_max - y1_min)
-    box2_area = (x2_max - x2_min) * (y2_max - y2_min)
-    union_area = box1_area + box2_area - intersection_area
-    
-    if union_area == 0:
-        return 0.0
-    
-    return intersection_area / union_area
-
-def apply_padding_to_bbox(bbox, padding_factor):
+def pad_bboxes(boxes, padding_factor):
     """
-    Apply padding to a bounding box.
-    
-    Args:
-        bbox: [xMin, xMax, yMin, yMax] in normalized coordinates
-        padding_factor: 0.0 = no padding, 1.0 = double size
-    
-    Returns:
-        Padded bounding box [xMin, xMax, yMin, yMax]
+    Apply padding to an (N, 4) array of [xMin, xMax, yMin, yMax] rows
+    in normalized coordinates, clipped to [0, 1].
+    padding_factor: 0.0 = no padding, 1.0 = double size
     """
-    if padding_factor == 0.0:
-        return bbox
-    
-    x_min, x_max, y_min, y_max = bbox
+    x_min, x_max, y_min, y_max = boxes.T
     
-    # Calculate center and dimensions
     center_x = (x_min + x_max) / 2
     center_y = (y_min + y_max) / 2
-    width = x_max - x_min
-    height = y_max - y_min
-    
-    # Apply padding
-    new_width = width * (1 + padding_factor)
-    new_height = height * (1 + padding_factor)
-    
-    # Calculate new coordinates
-    new_x_min = max(0.0, center_x - new_width / 2)
-    new_x_max = min(1.0, center_x + new_width / 2)
-    new_y_min = max(0.0, center_y - new_height / 2)
-    new_y_max = min(1.0, center_y + new_height / 2)
-    
-    return [new_x_min, new_x_max, new_y_min, new_y_max]
+    new_width = (x_max - x_min) * (1 + padding_factor)
+    new_height = (y_max - y_min) * (1 + padding_factor)
+    
+    return np.stack([
+        np.maximum(0.0, center_x - new_width / 2),
+        np.minimum(1.0, center_x + new_width / 2),
+        np.maximum(0.0, center_y - new_height / 2),
+        np.minimum(1.0, center_y + new_height / 2)
+    ], axis=1)
 
 def get_class_number(class_name):
     """Extract class number from class name (e.g., 'class1' -> 1, 'class2' -> 2)"""
     try:
+        return _parse_class_number(class_name)
+    except TypeError:
+        # Unhashable names can't be memoized and never parse anyway
+        return 0
+
+# Class names come from a tiny vocabulary, so each one is only ever parsed once
+@lru_cache(maxsize=64)
+def _parse_class_number(class_name):
+    try:
+        match = _CLASS_NAME_RE.fullmatch(class_name)
+        if match:
+            return int(match.group(2)) if match.group(1) else 0
+        if not _DIGIT_RE.search(class_name):
+            return 0
         if class_name.lower().startswith('class'):
             return int(class_name.lower().replace('class', ''))
         else:
@@ -1133,20 +1102,16 @@ def apply_nms(predictions, iou_threshold, padding_factor, max_predictions):
     if not predictions:
         return []
     
-    print(f"🔍 Applying NMS with IoU threshold: {iou_threshold}, padding: {padding_factor}, max predictions: {max_predictions}")
+    # A single prediction has nothing to suppress
+    if len(predictions) == 1:
+        return predictions[:max_predictions]
+    
+    logger.debug("🔍 Applying NMS with IoU threshold: %s, padding: %s, max predictions: %s", iou_threshold, padding_factor, max_predictions)
     
     # Sort predictions by class priority (higher class numbers first), then by confidence
     def sort_key(pred):
-        class_name = pred.get('displayName', 'Unknown')
         # Extract class number from class name (e.g., "class1" -> 1, "class2" -> 2)
-        try:
-            if class_name.lower().startswith('class'):
-                class_num = int(class_name.lower().replace('class', ''))
-            else:
-                # For non-class names, use a default priority
-                class_num = 0
-        except:
-            class_num = 0
+        class_num = get_class_number(pred.get('displayName', 'Unknown'))
         
         confidence = pred.get('confidence', 0.0)
         # Sort by class number (descending), then by confidence (descending)
@@ -1154,89 +1119,117 @@ def apply_nms(predictions, iou_threshold, padding_factor, max_predictions):
     
     sorted_predictions = sorted(predictions, key=sort_key)
     
-    # Apply NMS across all classes (higher class numbers can override lower ones)
-    filtered_predictions = []
-    for i, pred in enumerate(sorted_predictions):
-        should_keep = True
-        bbox1 = pred.get('bbox', [0, 0, 0, 0])
-        class_name1 = pred.get('displayName', 'Unknown')
-        
-        # Check against already selected predictions
-        for selected_pred in filtered_predictions:
-            bbox2 = selected_pred.get('bbox', [0, 0, 0, 0])
-            class_name2 = selected_pred.get('displayName', 'Unknown')
-            
-            # Apply padding to both boxes for IoU calculation
-            padded_bbox1 = apply_padding_to_bbox(bbox1, padding_factor)
-            padded_bbox2 = apply_padding_to_bbox(bbox2, padding_factor)
-            
-            # Calculate IoU using padded boxes
-            iou = calculate_iou(padded_bbox1, padded_bbox2)
-            
-            if iou > iou_threshold:
-                # If boxes overlap, check class priority
-                class_num1 = get_class_number(class_name1)
-                class_num2 = get_class_number(class_name2)
-                
-                if class_num1 > class_num2:
-                    # Current prediction has higher class priority, remove the selected one
-                    filtered_predictions.remove(selected_pred)
-                    print(f"  🔄 Replaced {class_name2} with higher priority {class_name1}")
-                    break
-                else:
-                    # Selected prediction has higher or equal class priority, skip current
-                    should_keep = False
-                    break
-        
-        if should_keep:
-            filtered_predictions.append(pred)
-    
-    print(f"  📊 Processed {len(sorted_predictions)} predictions, kept {len(filtered_predictions)}")
+    # IoU never exceeds 1.0, so at that threshold nothing is suppressed
+    if iou_threshold >= 1.0:
+        logger.debug("🎯 NMS disabled by threshold, keeping top %s predictions", max_predictions)
+        return sorted_predictions[:max_predictions]
+    
+    # Boxes as float64 columns [xMin, xMax, yMin, yMax] in priority order
+    boxes = np.array([pred.get('bbox', [0, 0, 0, 0]) for pred in sorted_predictions], dtype=np.float64).reshape(-1, 4)
+    if padding_factor != 0.0:
+        boxes = pad_bboxes(boxes, padding_factor)
+    x_min, x_max, y_min, y_max = boxes.T
+    areas = (x_max - x_min) * (y_max - y_min)
+    
+    # Apply NMS across all classes. The list is already sorted by class priority,
+    # so the best remaining box is always kept and suppresses everything it overlaps
+    keep = []
+    remaining = np.arange(len(sorted_predictions))
+    while remaining.size:
+        best = remaining[0]
+        keep.append(best)
+        rest = remaining[1:]
+        
+        # Overlap extents of the kept box against all remaining boxes at once
+        inter_w = np.minimum(x_max[best], x_max[rest]) - np.maximum(x_min[best], x_min[rest])
+        inter_h = np.minimum(y_max[best], y_max[rest]) - np.maximum(y_min[best], y_min[rest])
+        
+        # Boxes that don't overlap have IoU 0, so only the overlapping ones need the divide
+        overlap = (inter_w > 0) & (inter_h > 0)
+        suppress = np.full(rest.size, 0.0 > iou_threshold)
+        if overlap.any():
+            intersection = inter_w[overlap] * inter_h[overlap]
+            union = areas[best] + areas[rest[overlap]] - intersection
+            with np.errstate(divide='ignore', invalid='ignore'):
+                iou = np.where(union == 0, 0.0, intersection / union)
+            suppress[overlap] = iou > iou_threshold
+        
+        remaining = rest[~suppress]
+    
+    filtered_predictions = [sorted_predictions[i] for i in keep]
+    
+    logger.debug("  📊 Processed %s predictions, kept %s", len(sorted_predictions), len(filtered_predictions))
     
     # Limit to max_predictions
     if len(filtered_predictions) > max_predictions:
         filtered_predictions = filtered_predictions[:max_predictions]
     
-    print(f"🎯 NMS complete: {len(filtered_predictions)} final predictions")
+    logger.debug("🎯 NMS complete: %s final predictions", len(filtered_predictions))
     return filtered_predictions
 
-def create_annotated_image(image_bytes, predictions, padding_factor=0.0):
+def open_image(image_bytes):
+    """Decode image bytes into an RGB PIL image, or None if the image cannot be decoded"""
+    try:
+        # Decode now so corrupt data is caught here, and only convert non-RGB
+        # images since convert("RGB") on an RGB JPEG is a full-frame copy
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        logger.debug("📐 Image dimensions: %sx%s", image.size[0], image.size[1])
+        return image
+    except Exception as e:
+        logger.error("❌ Error decoding image: %s", e)
+        return None
+
+def load_label_font():
+    """Load the bold label font, falling back to Pillow's default if none is available"""
+    try:
+        # Try multiple font paths for better compatibility
+        font_paths = [
+            "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+            "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
+            "/System/Library/Fonts/Arial.ttf",  # macOS
+            "arial.ttf"  # Windows
+        ]
+        for font_path in font_paths:
+            try:
+                return ImageFont.truetype(font_path, 20)
+            except (IOError, OSError):
+                continue
+        
+        return ImageFont.load_default()
+    except:
+        return ImageFont.load_default()
+
+# Loaded once per process instead of probing the font paths on every annotation
+_LABEL_FONT = load_label_font()
+
+@lru_cache(maxsize=1024)
+def get_label_bbox(text):
+    """Ink bounding box of a label drawn at the origin with the label font"""
+    return _LABEL_FONT.getbbox(text)
+
+def annotate_image(image, predictions, padding_factor=0.0, mask=None):
     """
-    Create an annotated image with bounding boxes and labels.
+    Draw bounding boxes and labels onto a copy of an already decoded image.
     Properly handles Vertex AI normalized coordinates [xMin, xMax, yMin, yMax].
     Applies padding factor to expand bounding boxes before drawing.
+    
+    If mask is given (an 'L' image of the same size), every box and label is
+    also drawn into it at 255, recording which pixels the overlay covers.
+    
+    Returns the annotated PIL image, leaving the original untouched.
     """
     try:
-        print(f"🎨 Creating annotated image with {len(predictions)} predictions")
+        logger.debug("🎨 Creating annotated image with %s predictions", len(predictions))
         
-        # Open image and convert to RGB to ensure compatibility
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        image = image.copy()
         draw = ImageDraw.Draw(image)
+        mask_draw = ImageDraw.Draw(mask) if mask is not None else None
         img_width, img_height = image.size
         
-        print(f"📐 Image dimensions: {img_width}x{img_height}")
-        
-        # Try to load a better font, fall back to default if not available
-        try:
-            # Try multiple font paths for better compatibility
-            font_paths = [
-                "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-                "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
-                "/System/Library/Fonts/Arial.ttf",  # macOS
-                "arial.ttf"  # Windows
-            ]
-            font = None
-            for font_path in font_paths:
-                try:
-                    font = ImageFont.truetype(font_path, 20)
-                    break
-                except (IOError, OSError):
-                    continue
-            
-            if font is None:
-                font = ImageFont.load_default()
-        except:
-            font = ImageFont.load_default()
+        font = _LABEL_FONT
         
         # Define consistent colors for different classes
         def get_class_color(class_name):
@@ -1255,33 +1248,37 @@ def create_annotated_image(image_bytes, predictions, padding_factor=0.0):
             else:
                 return 'blue'  # default
         
+        # Pull the fields out of the prediction dicts once, as parallel columns
+        bboxes = [pred.get('bbox', [0, 0, 0, 0]) for pred in predictions]
+        class_names = [pred.get('displayName', 'Unknown') for pred in predictions]
+        confidences = [pred.get('confidence', 0.0) for pred in predictions]
+        
+        # Vertex AI returns normalized coordinates as [xMin, xMax, yMin, yMax];
+        # pad, convert to absolute pixel coordinates and clip to the image for all boxes at once
+        boxes = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+        if padding_factor != 0.0:
+            boxes = pad_bboxes(boxes, padding_factor)
+        pixel_boxes = boxes * np.array([img_width, img_width, img_height, img_height], dtype=np.float64)
+        np.clip(pixel_boxes[:, :2], 0, img_width, out=pixel_boxes[:, :2])
+        np.clip(pixel_boxes[:, 2:], 0, img_height, out=pixel_boxes[:, 2:])
+        valid = (pixel_boxes[:, 1] > pixel_boxes[:, 0]) & (pixel_boxes[:, 3] > pixel_boxes[:, 2])
+        
+        # Per-box logging is only worth formatting when debugging
+        debug = logger.isEnabledFor(logging.DEBUG)
+        
         # Draw bounding boxes and labels
-        for i, pred in enumerate(predictions):
-            bbox = pred.get('bbox', [0, 0, 0, 0])
-            class_name = pred.get('displayName', 'Unknown')
-            confidence = pred.get('confidence', 0.0)
+        for i, (x_min, x_max, y_min, y_max) in enumerate(pixel_boxes.tolist()):
+            bbox = bboxes[i]
+            class_name = class_names[i]
+            confidence = confidences[i]
             
-            print(f"🎯 Drawing box {i+1}: {class_name} ({confidence:.2f}) at {bbox}")
-            
-            # Apply padding factor to the bounding box before drawing
-            padded_bbox = apply_padding_to_bbox(bbox, padding_factor)
-            
-            # Vertex AI returns normalized coordinates as [xMin, xMax, yMin, yMax]
-            # Convert to absolute pixel coordinates
-            x_min = padded_bbox[0] * img_width
-            x_max = padded_bbox[1] * img_width
-            y_min = padded_bbox[2] * img_height
-            y_max = padded_bbox[3] * img_height
-            
-            # Ensure coordinates are within image bounds
-            x_min = max(0, min(x_min, img_width))
-            x_max = max(0, min(x_max, img_width))
-            y_min = max(0, min(y_min, img_height))
-            y_max = max(0, min(y_max, img_height))
+            if debug:
+                logger.debug("🎯 Drawing box %d: %s (%.2f) at %s", i + 1, class_name, confidence, bbox)
             
             # Skip invalid bounding boxes
-            if x_max <= x_min or y_max <= y_min:
-                print(f"⚠️ Skipping invalid bounding box: {bbox}")
+            if not valid[i]:
+                if debug:
+                    logger.debug("⚠️ Skipping invalid bounding box: %s", bbox)
                 continue
             
             # Get consistent color for class
@@ -1297,8 +1294,10 @@ def create_annotated_image(image_bytes, predictions, padding_factor=0.0):
             # Prepare label text
             display_text = f"{class_name}: {confidence:.2f}"
             
-            # Get text bounding box for background
-            text_bbox = draw.textbbox((x_min, y_min - 25), display_text, font=font)
+            # Get text bounding box for background; labels repeat across boxes and
+            # requests, so the glyph layout is cached per text and offset here
+            left, top, right, bottom = get_label_bbox(display_text)
+            text_bbox = (x_min + left, y_min - 25 + top, x_min + right, y_min - 25 + bottom)
             
             # Draw label background rectangle
             draw.rectangle(text_bbox, fill=color)
@@ -1312,31 +1311,156 @@ def create_annotated_image(image_bytes, predictions, padding_factor=0.0):
                 font=font
             )
             
-            print(f"✅ Drew bounding box: {class_name} at ({x_min:.0f},{y_min:.0f})-({x_max:.0f},{y_max:.0f})")
-        
-        # Convert to base64 for sending to frontend
-        buffer = io.BytesIO()
-        image.save(buffer, format='JPEG', quality=95)
-        img_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
+            # Record the pixels this box and its label cover
+            if mask_draw is not None:
+                mask_draw.rectangle([(x_min, y_min), (x_max, y_max)], outline=255, width=4)
+                mask_draw.rectangle(text_bbox, fill=255)
+                mask_draw.text((x_min, y_min - 25), display_text, fill=255, font=font)
+            
+            if debug:
+                logger.debug("✅ Drew bounding box: %s at (%.0f,%.0f)-(%.0f,%.0f)", class_name, x_min, y_min, x_max, y_max)
         
-        print(f"✅ Annotated image created successfully")
-        return f"data:image/jpeg;base64,{img_str}"
+        logger.debug("✅ Annotated image created successfully")
+        return image
         
     except Exception as e:
-        print(f"❌ Error creating annotated image: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error creating annotated image: %s", e)
+        return None
+
+def image_to_data_url(image):
+    """Encode a PIL image as a JPEG data URL for sending to the frontend"""
+    # Reuse this thread's encode buffer; only the first tell() bytes belong to this image
+    buffer = getattr(_ENCODE_BUFFERS, 'buffer', None)
+    if buffer is None:
+        buffer = _ENCODE_BUFFERS.buffer = io.BytesIO()
+    buffer.seek(0)
+    
+    image.save(buffer, format='JPEG', quality=85, optimize=False)
+    with buffer.getbuffer() as view:
+        img_str = base64.b64encode(view[:buffer.tell()]).decode('ascii')
+    
+    return f"data:image/jpeg;base64,{img_str}"
+
+def create_annotated_image(image_bytes, predictions, padding_factor=0.0):
+    """
+    Create an annotated image with bounding boxes and labels.
+    Decodes the image, draws the predictions and returns a JPEG data URL.
+    """
+    image = open_image(image_bytes)
+    if image is None:
+        return None
+    
+    annotated_image = annotate_image(image, predictions, padding_factor)
+    if annotated_image is None:
+        return None
+    
+    try:
+        return image_to_data_url(annotated_image)
+    except Exception as e:
+        logger.error("❌ Error encoding annotated image: %s", e)
         return None
 
-def parse_multipart_data(body, content_type):
-    """Parse multipart form data from request body"""
+@dataclass(frozen=True)
+class ModelParameters:
+    """Typed, validated prediction parameters for one model"""
+    confidence: float
+    iou_threshold: float
+    padding_factor: float
+    max_predictions: int
+
+class InvalidParameterError(ValueError):
+    """A prediction parameter form field could not be parsed; reported to the client as a 400"""
+
+def _parse_bounded_float(form, name, default, minimum, maximum=None):
+    """Parse a float form field and clamp it to [minimum, maximum]"""
+    value = form.getfirst(name, default)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise InvalidParameterError(f"Invalid numeric parameter {name}: {value!r}") from None
+    if not math.isfinite(number):
+        raise InvalidParameterError(f"Invalid numeric parameter {name}: {value!r}")
+    number = max(number, minimum)
+    return min(number, maximum) if maximum is not None else number
+
+def parse_model_parameters(form, prefix):
+    """Parse the <prefix>Confidence/NMS/Padding/MaxPred form fields into ModelParameters"""
+    return ModelParameters(
+        confidence=_parse_bounded_float(form, f'{prefix}Confidence', 0.2, 0.0, 1.0),
+        iou_threshold=_parse_bounded_float(form, f'{prefix}NMS', 0.0, 0.0, 1.0),
+        padding_factor=_parse_bounded_float(form, f'{prefix}Padding', 0.5, 0.0),
+        # Clients may send MaxPred as "100.0", so parse it as a float before truncating
+        max_predictions=int(_parse_bounded_float(form, f'{prefix}MaxPred', 100, 1.0))
+    )
+
+# Form fields read by parse_multipart_data, registered up front with the streaming parser
+FORM_FIELDS = (
+    'image', 'runDensityModel', 'runThicknessModel', 'save_to_database',
+    'return_annotated', 'return_combined'
+) + tuple(
+    f'{prefix}{field}'
+    for prefix in ('density', 'thickness')
+    for field in ('Confidence', 'NMS', 'Padding', 'MaxPred')
+)
+
+# Request bodies are fed to the parser in chunks of this size
+MULTIPART_CHUNK_SIZE = 64 * 1024
+
+# Larger uploads are rejected before any of the body is read
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+if STREAMING_FORM_DATA_AVAILABLE:
+    class FormFieldTarget(ValueTarget):
+        """ValueTarget that also records whether the field was sent at all"""
+        def __init__(self):
+            super().__init__()
+            self.received = False
+        
+        def on_start(self):
+            self.received = True
+
+class StreamingForm:
+    """Parse a multipart body from a stream, exposing cgi.FieldStorage-style getfirst()"""
+    def __init__(self, content_type, field_names=FORM_FIELDS):
+        self.parser = StreamingFormDataParser(headers={'Content-Type': content_type})
+        self.targets = {}
+        for name in field_names:
+            target = FormFieldTarget()
+            self.parser.register(name, target)
+            self.targets[name] = target
+    
+    def read(self, rfile, content_length):
+        """Feed up to content_length bytes from rfile to the parser"""
+        remaining = content_length
+        while remaining > 0:
+            chunk = rfile.read(min(remaining, MULTIPART_CHUNK_SIZE))
+            if not chunk:
+                break
+            self.parser.data_received(chunk)
+            remaining -= len(chunk)
+    
+    def getfirst(self, name, default=None):
+        """Return a field's value: bytes for file uploads, str otherwise, default if absent"""
+        target = self.targets.get(name)
+        if target is None or not target.received:
+            return default
+        if target.multipart_filename is not None:
+            return target.value
+        return target.value.decode('utf-8', 'replace')
+
+def parse_multipart_data(rfile, content_length, content_type):
+    """Parse multipart form data from the request body stream"""
     try:
         # Parse the multipart data
-        form = cgi.FieldStorage(
-            fp=io.BytesIO(body),
-            headers={'content-type': content_type},
-            environ={'REQUEST_METHOD': 'POST'}
-        )
+        if STREAMING_FORM_DATA_AVAILABLE:
+            form = StreamingForm(content_type)
+            form.read(rfile, content_length)
+        else:
+            form = cgi.FieldStorage(
+                fp=io.BytesIO(rfile.read(content_length)),
+                headers={'content-type': content_type},
+                environ={'REQUEST_METHOD': 'POST'}
+            )
         
         # Extract form data
         image_file = form.getfirst('image')
@@ -1346,85 +1470,93 @@ def parse_multipart_data(body, content_type):
         run_thickness_model = form.getfirst('runThicknessModel', 'false').lower() == 'true'
         save_to_database = form.getfirst('save_to_database', 'false').lower() == 'true'
         
-        print(f"🔍 Model selection from form:")
-        print(f"  - runDensityModel raw: '{form.getfirst('runDensityModel', 'false')}'")
-        print(f"  - runThicknessModel raw: '{form.getfirst('runThicknessModel', 'false')}'")
-        print(f"  - save_to_database raw: '{form.getfirst('save_to_database', 'false')}'")
-        print(f"  - run_density_model: {run_density_model}")
-        print(f"  - run_thickness_model: {run_thickness_model}")
-        print(f"  - save_to_database: {save_to_database}")
-        
-        # Density model parameters
-        density_confidence = float(form.getfirst('densityConfidence', 0.2))
-        density_iou_threshold = float(form.getfirst('densityNMS', 0.0))
-        density_padding_factor = float(form.getfirst('densityPadding', 0.5))
-        density_max_predictions = int(form.getfirst('densityMaxPred', 100))
-        
-        # Thickness model parameters
-        thickness_confidence = float(form.getfirst('thicknessConfidence', 0.2))
-        thickness_iou_threshold = float(form.getfirst('thicknessNMS', 0.0))
-        thickness_padding_factor = float(form.getfirst('thicknessPadding', 0.5))
-        thickness_max_predictions = int(form.getfirst('thicknessMaxPred', 100))
+        # Annotated images are the most expensive part of the response, let callers opt out
+        return_annotated = form.getfirst('return_annotated', 'true').lower() == 'true'
+        # Combined metrics/image are only needed by clients that show the merged view
+        return_combined = form.getfirst('return_combined', 'true').lower() == 'true'
+        
+        logger.debug("🔍 Model selection from form: run_density_model=%s, run_thickness_model=%s, save_to_database=%s",
+                     run_density_model, run_thickness_model, save_to_database)
+        
+        # Per-model parameters, parsed and validated once
+        density_params = parse_model_parameters(form, 'density')
+        thickness_params = parse_model_parameters(form, 'thickness')
         
         return {
             'image': image_file,
             'run_density_model': run_density_model,
             'run_thickness_model': run_thickness_model,
             'save_to_database': save_to_database,
-            'density_confidence': density_confidence,
-            'density_iou_threshold': density_iou_threshold,
-            'density_padding_factor': density_padding_factor,
-            'density_max_predictions': density_max_predictions,
-            'thickness_confidence': thickness_confidence,
-            'thickness_iou_threshold': thickness_iou_threshold,
-            'thickness_padding_factor': thickness_padding_factor,
-            'thickness_max_predictions': thickness_max_predictions
+            'return_annotated': return_annotated,
+            'return_combined': return_combined,
+            'density_params': density_params,
+            'thickness_params': thickness_params
         }
+    except InvalidParameterError:
+        # Let do_POST report the offending field instead of a generic missing-image error
+        raise
     except Exception as e:
-        print(f"❌ Error parsing multipart data: {e}")
+        logger.error("❌ Error parsing multipart data: %s", e)
         return None
 
+# Headers shared by every JSON response, serialized once instead of per send_header call
+_JSON_RESPONSE_HEADERS = (
+    b"Content-Type: application/json\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Access-Control-Allow-Methods: POST, OPTIONS, GET\r\n"
+    b"Access-Control-Allow-Headers: Content-Type, Authorization\r\n"
+    b"Access-Control-Max-Age: 86400\r\n"
+)
+
 class handler(BaseHTTPRequestHandler):
+    # Every response carries Content-Length, so clients can keep the connection open
+    protocol_version = "HTTP/1.1"
+    
     def do_GET(self):
         """Handle GET requests for health checks and testing"""
         if self.path == '/api/upload' or self.path == '/api/upload/':
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS, GET')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-            self.end_headers()
-            
             response_data = {
                 'status': 'healthy',
                 'message': 'Image recognition API is running',
                 'google_auth_available': GOOGLE_AUTH_AVAILABLE,
-                'vertex_ai_enabled': check_vertex_ai_enabled()
+                'vertex_ai_enabled': VERTEX_AI_ENABLED
             }
             
-            response_json = json.dumps(response_data)
-            self.wfile.write(response_json.encode('utf-8'))
+            self.send_json(200, dumps_json_bytes(response_data))
             return
+        
+        self.send_error_response('Not found', 404)
     
     def do_POST(self):
-        print(f"🔍 POST REQUEST RECEIVED - Starting do_POST method")
+        logger.debug("🔍 POST REQUEST RECEIVED - Starting do_POST method")
         try:
             # Get content length and type
             content_length = int(self.headers.get('Content-Length', 0))
             content_type = self.headers.get('Content-Type', '')
             
-            print(f"🔍 Request details: Content-Length={content_length}, Content-Type={content_type}")
+            logger.debug("🔍 Request details: Content-Length=%s, Content-Type=%s", content_length, content_type)
             
-            # Read request body
-            body = self.rfile.read(content_length)
-            print(f"🔍 Body read successfully, length: {len(body)}")
+            # Reject bodies we can't or won't parse before reading them
+            if content_length > MAX_UPLOAD_BYTES:
+                logger.warning("❌ Upload too large: %s bytes", content_length)
+                self.send_error_response('Payload too large', 413)
+                return
+            if not content_type.lower().startswith('multipart/form-data'):
+                logger.warning("❌ Unsupported Content-Type: %s", content_type)
+                self.send_error_response('Content-Type must be multipart/form-data', 400)
+                return
             
-            # Parse multipart form data
-            form_data = parse_multipart_data(body, content_type)
-            print(f"🔍 Form data parsed successfully: {form_data is not None}")
+            # Parse multipart form data straight from the request stream
+            try:
+                form_data = parse_multipart_data(self.rfile, content_length, content_type)
+            except InvalidParameterError as e:
+                logger.warning("❌ %s", e)
+                self.send_error_response(str(e), 400)
+                return
+            logger.debug("🔍 Form data parsed successfully: %s", form_data is not None)
             
             if not form_data or not form_data['image']:
-                print(f"❌ No image file provided - form_data: {form_data is not None}, image: {form_data.get('image') if form_data else 'None'}")
+                logger.warning("❌ No image file provided - form_data: %s", form_data is not None)
                 self.send_error_response('No image file provided', 400)
                 return
             
@@ -1432,10 +1564,13 @@ class handler(BaseHTTPRequestHandler):
             run_density_model = form_data['run_density_model']
             run_thickness_model = form_data['run_thickness_model']
             save_to_database = form_data['save_to_database']
+            return_annotated = form_data['return_annotated']
+            return_combined = form_data['return_combined']
+            density_params = form_data['density_params']
+            thickness_params = form_data['thickness_params']
             
-            print(f"🖼️ Processing image - Density: {run_density_model}, Thickness: {run_thickness_model}, Save to DB: {save_to_database}")
-            print(f"🔍 DEBUG: save_to_database type: {type(save_to_database)}, value: '{save_to_database}'")
-            print(f"🔍 DEBUG: POSTGRES_AVAILABLE: {POSTGRES_AVAILABLE}")
+            logger.debug("🖼️ Processing image - Density: %s, Thickness: %s, Save to DB: %s",
+                         run_density_model, run_thickness_model, save_to_database)
             
             # Convert image file to bytes
             if hasattr(form_data['image'], 'file'):
@@ -1451,23 +1586,61 @@ class handler(BaseHTTPRequestHandler):
                 'combined_annotated_image': None
             }
             
-            # Store predictions for combined image
+            # Store predictions and annotated images for the combined image
             density_predictions = None
             thickness_predictions = None
+            density_image = None
+            thickness_image = None
+            thickness_mask = None
+            
+            # Both models send the same compressed image, so encode it only once
+            image_content = None
+            if VERTEX_AI_ENABLED and run_density_model and run_thickness_model:
+                image_content = encode_image_content(image_bytes)
+            
+            # Start both models on the worker pool so their Vertex AI round trips
+            # overlap with each other and with decoding the upload on this thread
+            thickness_future = None
+            if run_thickness_model:
+                logger.debug("🔍 Running thickness model...")
+                thickness_future = _EXECUTOR.submit(
+                    predict_thickness_model_rest,
+                    image_bytes, 
+                    thickness_params.confidence, 
+                    thickness_params.iou_threshold,
+                    thickness_params.padding_factor,
+                    thickness_params.max_predictions,
+                    image_content
+                )
             
-            # Process density model if selected
+            density_future = None
             if run_density_model:
-                print("🔍 Running density model...")
-                density_predictions = predict_image_object_detection(
+                logger.debug("🔍 Running density model...")
+                density_future = _EXECUTOR.submit(
+                    predict_image_object_detection,
                     image_bytes, 
-                    form_data['density_confidence'], 
-                    form_data['density_iou_threshold'],
-                    form_data['density_padding_factor'],
-                    form_data['density_max_predictions']
+                    density_params.confidence, 
+                    density_params.iou_threshold,
+                    density_params.padding_factor,
+                    density_params.max_predictions,
+                    image_content
                 )
+            
+            # Decode the upload once, while the predictions are in flight, and share
+            # it between all annotated images
+            original_image = None
+            if return_annotated and (density_future is not None or thickness_future is not None):
+                original_image = open_image(image_bytes)
+            
+            # Collect density model results if selected
+            if density_future is not None:
+                density_predictions = density_future.result()
                 
                 if density_predictions:
-                    density_annotated_image = create_annotated_image(image_bytes, density_predictions, form_data['density_padding_factor'])
+                    density_annotated_image = None
+                    if return_annotated:
+                        density_image = annotate_image(original_image, density_predictions, density_params.padding_factor) if original_image is not None else None
+                        density_annotated_image = image_to_data_url(density_image) if density_image is not None else None
                     density_metrics = calculate_follicular_metrics(density_predictions)
                     
                     response_data['density_results'] = {
@@ -1477,27 +1650,22 @@ class handler(BaseHTTPRequestHandler):
                         'total_predictions': len(density_predictions)
                     }
             
-            # Process thickness model if selected
-            if run_thickness_model:
-                print("🔍 Running thickness model...")
-                thickness_predictions = predict_thickness_model_rest(
-                    image_bytes, 
-                    form_data['thickness_confidence'], 
-                    form_data['thickness_iou_threshold'],
-                    form_data['thickness_padding_factor'],
-                    form_data['thickness_max_predictions']
-                )
+            # Collect thickness model results if selected
+            if thickness_future is not None:
+                thickness_predictions = thickness_future.result()
                 
                 if thickness_predictions:
-                    thickness_annotated_image = create_annotated_image(image_bytes, thickness_predictions, form_data['thickness_padding_factor'])
+                    thickness_annotated_image = None
+                    if return_annotated and original_image is not None:
+                        # Only the combined image needs to know which pixels the thickness overlay covers
+                        if return_combined and density_image is not None:
+                            thickness_mask = Image.new('L', original_image.size, 0)
+                        thickness_image = annotate_image(original_image, thickness_predictions, thickness_params.padding_factor, thickness_mask)
+                        thickness_annotated_image = image_to_data_url(thickness_image) if thickness_image is not None else None
                     
                     # Calculate thickness metrics
-                    thickness_metrics = {
-                        'strong': sum(1 for p in thickness_predictions if p['displayName'] == 'strong'),
-                        'medium': sum(1 for p in thickness_predictions if p['displayName'] == 'medium'),
-                        'weak': sum(1 for p in thickness_predictions if p['displayName'] == 'weak'),
-                        'total_detections': len(thickness_predictions)
-                    }
+                    thickness_metrics = count_thickness_classes(thickness_predictions)
+                    thickness_metrics['total_detections'] = len(thickness_predictions)
                     
                     response_data['thickness_results'] = {
                         'annotated_image': thickness_annotated_image,
@@ -1507,38 +1675,32 @@ class handler(BaseHTTPRequestHandler):
                     }
             
             # Create combined annotated image if both models were run
-            if density_predictions and thickness_predictions:
-                print("🎨 Creating combined image with both overlays...")
+            if return_combined and density_image is not None and thickness_image is not None:
+                logger.debug("🎨 Creating combined image with both overlays...")
                 combined_image = create_combined_annotated_image(
-                    image_bytes, 
-                    density_predictions, 
-                    thickness_predictions, 
-                    form_data['density_padding_factor'],
-                    form_data['thickness_padding_factor']
+                    density_image,
+                    thickness_image,
+                    thickness_mask
                 )
                 if combined_image:
                     response_data['combined_annotated_image'] = combined_image
             
-            # Calculate combined metrics if we have any predictions
-            if density_predictions or thickness_predictions:
-                print("📊 Calculating combined metrics...")
+            # Calculate combined metrics if requested and we have any predictions
+            if return_combined and (density_predictions or thickness_predictions):
+                logger.debug("📊 Calculating combined metrics...")
                 combined_metrics = calculate_combined_metrics(density_predictions, thickness_predictions)
                 response_data['combined_metrics'] = combined_metrics
             
-            print(f"🔍 ABOUT TO ENTER DATABASE STORAGE SECTION")
-            print(f"🔍 Current response_data keys: {list(response_data.keys())}")
-            
             # Store results in database if requested and PostgreSQL is available
             upload_id = None
-            print(f"🔍 REACHED DATABASE STORAGE SECTION")
-            print(f"🔍 Database storage check: save_to_database={save_to_database}, POSTGRES_AVAILABLE={POSTGRES_AVAILABLE}")
+            logger.debug("🔍 Database storage check: save_to_database=%s, POSTGRES_AVAILABLE=%s", save_to_database, POSTGRES_AVAILABLE)
             
             if save_to_database and POSTGRES_AVAILABLE:
-                print("💾 Storing analysis results in PostgreSQL...")
+                logger.debug("💾 Storing analysis results in PostgreSQL...")
                 
                 # Get user_id from form data (camera app sends this)
                 user_id = form_data.get('user_id', 'unknown')
-                print(f"🔍 User ID from form data: '{user_id}'")
+                logger.debug("🔍 User ID from form data: '%s'", user_id)
                 
                 # Prepare analysis data for storage (matching existing table structure)
                 analysis_data = {
@@ -1552,14 +1714,14 @@ class handler(BaseHTTPRequestHandler):
                     'thickness_results': response_data.get('thickness_results'),
                     'combined_metrics': response_data.get('combined_metrics'),
                     'model_parameters': {
-                        'density_confidence': form_data['density_confidence'],
-                        'density_iou_threshold': form_data['density_iou_threshold'],
-                        'density_padding_factor': form_data['density_padding_factor'],
-                        'density_max_predictions': form_data['density_max_predictions'],
-                        'thickness_confidence': form_data['thickness_confidence'],
-                        'thickness_iou_threshold': form_data['thickness_iou_threshold'],
-                        'thickness_padding_factor': form_data['thickness_padding_factor'],
-                        'thickness_max_predictions': form_data['thickness_max_predictions']
+                        'density_confidence': density_params.confidence,
+                        'density_iou_threshold': density_params.iou_threshold,
+                        'density_padding_factor': density_params.padding_factor,
+                        'density_max_predictions': density_params.max_predictions,
+                        'thickness_confidence': thickness_params.confidence,
+                        'thickness_iou_threshold': thickness_params.iou_threshold,
+                        'thickness_padding_factor': thickness_params.padding_factor,
+                        'thickness_max_predictions': thickness_params.max_predictions
                     },
                     'image_metadata': {
                         'image_size_bytes': len(image_bytes),
@@ -1567,27 +1729,25 @@ class handler(BaseHTTPRequestHandler):
                     }
                 }
                 
-                print(f"🔍 Analysis data prepared: {json.dumps(analysis_data, indent=2)}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("🔍 Analysis data prepared: %s", json.dumps(analysis_data, indent=2))
                 
                 upload_id = store_analysis_results_via_api(user_id, analysis_data)
-                print(f"🔍 Storage API returned upload_id: {upload_id}")
                 
                 if upload_id:
                     response_data['upload_id'] = upload_id
-                    print(f"✅ Analysis results stored with upload_id: {upload_id}")
+                    logger.info("✅ Analysis results stored with upload_id: %s", upload_id)
                 else:
-                    print("⚠️ Failed to store analysis results in database")
+                    logger.warning("⚠️ Failed to store analysis results in database")
             elif save_to_database and not POSTGRES_AVAILABLE:
-                print("⚠️ Database storage requested but PostgreSQL module not available")
+                logger.warning("⚠️ Database storage requested but PostgreSQL module not available")
             else:
-                print(f"🔍 Database storage not requested: save_to_database={save_to_database}")
+                logger.debug("🔍 Database storage not requested")
             
             self.send_success_response(response_data)
             
         except Exception as e:
-            print(f"❌ Error processing request: {e}")
-            import traceback
-            print(f"❌ Full traceback: {traceback.format_exc()}")
+            logger.exception("❌ Error processing request: %s", e)
             self.send_error_response(str(e), 500)
     
     def do_OPTIONS(self):
@@ -1596,31 +1756,50 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
+    def send_json(self, status_code, body):
+        """
+        Send the status line, the pre-serialized JSON/CORS header block, Content-Length and the body.
+        
+        Headers and body are handed to the socket as one scatter-gather sendmsg call,
+        so the multi-MB body is never concatenated with the headers or split across
+        separate header/body writes.
+        """
+        self.send_response(status_code)
+        self._headers_buffer.append(_JSON_RESPONSE_HEADERS)
+        # An explicit length lets clients read the body without waiting for the close
+        self._headers_buffer.append(b"Content-Length: %d\r\n" % len(body))
+        if self.close_connection:
+            self._headers_buffer.append(b"Connection: close\r\n")
+        self._headers_buffer.append(b"\r\n")
+        chunks = self._headers_buffer + [body]
+        self._headers_buffer = []
+        
+        sendmsg = getattr(self.connection, 'sendmsg', None)
+        if sendmsg is None:
+            for chunk in chunks:
+                self.wfile.write(chunk)
+            return
+        
+        # sendmsg may write only part of the data, resume from where it stopped
+        views = [memoryview(chunk) for chunk in chunks]
+        while views:
+            sent = sendmsg(views)
+            while views and sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            if views and sent:
+                views[0] = views[0][sent:]
+    
     def send_success_response(self, data):
         """Send successful response"""
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS, GET')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.send_header('Access-Control-Max-Age', '86400')
-        self.end_headers()
-        
-        response_json = json.dumps(data)
-        self.wfile.write(response_json.encode('utf-8'))
+        self.send_json(200, dumps_json_bytes(data))
     
     def send_error_response(self, message, status_code):
         """Send error response"""
-        self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS, GET')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.send_header('Access-Control-Max-Age', '86400')
-        self.end_headers()
-        
+        # The request body may not have been fully read, so don't reuse the connection
+        self.close_connection = True
         error_data = {'error': message}
-        response_json = json.dumps(error_data)
-        self.wfile.write(response_json.encode('utf-8'))
\ No newline at end of file
+        self.send_json(status_code, dumps_json_bytes(error_data))
\ No newline at end of file
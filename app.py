@@ -1,17 +1,45 @@
 import os
-import json
-import base64
 from io import BytesIO
+from functools import lru_cache
+from collections import Counter
 from flask import Flask, render_template, request, jsonify, send_file
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 from google.cloud import aiplatform
-from google.auth import default
-import tempfile
+
+# pybase64 is a SIMD-accelerated drop-in for the stdlib module
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+# orjson serializes the multi-MB annotated image strings in C, straight to bytes
+try:
+    import orjson
+    from flask.json.provider import JSONProvider
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+if ORJSON_AVAILABLE:
+    class OrjsonProvider(JSONProvider):
+        """Flask JSON provider backed by orjson, used by jsonify and request.get_json"""
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj).decode('utf-8')
+        
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+        
+        def response(self, *args, **kwargs):
+            # Hand orjson's bytes to the response as-is instead of going through str
+            obj = args[0] if len(args) == 1 else (args or kwargs or None)
+            return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+    
+    app.json = OrjsonProvider(app)
+
 # Configure Google Cloud credentials
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = os.getenv('GOOGLE_APPLICATION_CREDENTIALS', '')
 project_id = os.getenv('GOOGLE_CLOUD_PROJECT', '27458468732')
@@ -79,33 +107,25 @@ def upload_image():
         iou_threshold = float(request.form.get('iouThreshold', 0.5))
         max_predictions = int(request.form.get('maxPredictions', 100))
         
-        # Save uploaded image temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-            file.save(tmp_file.name)
-            tmp_path = tmp_file.name
+        # Read the upload once and share the bytes between prediction and annotation
+        image_bytes = file.read()
         
         # Call Vertex AI for prediction
         predictions = predict_image_object_detection(
-            tmp_path, 
+            image_bytes, 
             confidence_threshold, 
             iou_threshold, 
             max_predictions
         )
         
-        # Clean up temporary file
-        os.unlink(tmp_path)
-        
         if not predictions:
             return jsonify({'error': 'No predictions returned from model'}), 400
         
         # Process predictions and create annotated image
-        annotated_image_data = create_annotated_image(file, predictions)
+        annotated_image_data = create_annotated_image(image_bytes, predictions)
         
         # Count predictions by class
-        class_counts = {}
-        for pred in predictions:
-            class_name = pred.get('displayName', 'Unknown')
-            class_counts[class_name] = class_counts.get(class_name, 0) + 1
+        class_counts = dict(Counter(pred.get('displayName', 'Unknown') for pred in predictions))
         
         return jsonify({
             'success': True,
@@ -118,20 +138,26 @@ def upload_image():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def predict_image_object_detection(image_path, confidence_threshold, iou_threshold, max_predictions):
+# Vertex AI Endpoint client, created on first use and then reused
+_endpoint = None
+
+def get_endpoint():
+    """Return the shared Endpoint client, resolving the resource only once"""
+    global _endpoint
+    if _endpoint is None:
+        _endpoint = aiplatform.Endpoint(endpoint_name=endpoint_id)
+    return _endpoint
+
+def predict_image_object_detection(image_bytes, confidence_threshold, iou_threshold, max_predictions):
     """Call Vertex AI endpoint for image object detection"""
     try:
-        endpoint = aiplatform.Endpoint(endpoint_name=endpoint_id)
-        
-        # Read and encode image
-        with open(image_path, 'rb') as f:
-            image_bytes = f.read()
+        endpoint = get_endpoint()
         
         # Prepare prediction request
         prediction_request = {
             'instances': [{
                 'image': {
-                    'bytesBase64Encoded': base64.b64encode(image_bytes).decode('utf-8')
+                    'bytesBase64Encoded': base64.b64encode(image_bytes).decode('ascii')
                 }
             }],
             'parameters': {
@@ -184,38 +210,54 @@ def get_mock_predictions():
         }
     ]
 
-def create_annotated_image(file, predictions):
+def load_label_font():
+    """Load the label font, falling back to default if not available"""
+    try:
+        return ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 16)
+    except:
+        return ImageFont.load_default()
+
+# Loaded once per process instead of on every annotation
+_LABEL_FONT = load_label_font()
+
+@lru_cache(maxsize=1024)
+def get_label_bbox(label):
+    """Ink bounding box of a label drawn at the origin with the label font"""
+    return _LABEL_FONT.getbbox(label)
+
+def create_annotated_image(image_bytes, predictions):
     """Create an annotated image with bounding boxes and labels"""
     try:
-        # Open image
-        image = Image.open(file.stream)
+        # Open image, converting only non-RGB uploads since JPEG output needs RGB
+        image = Image.open(BytesIO(image_bytes))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
         draw = ImageDraw.Draw(image)
         
-        # Try to load a font, fall back to default if not available
-        try:
-            font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 16)
-        except:
-            font = ImageFont.load_default()
+        font = _LABEL_FONT
+        
+        # Convert all normalized [x1, y1, x2, y2] boxes to clipped pixel coordinates at once
+        width, height = image.size
+        scale = np.array([width, height, width, height], dtype=np.float64)
+        boxes = np.array([pred.get('bbox', [0, 0, 0, 0]) for pred in predictions], dtype=np.float64).reshape(-1, 4)
+        boxes = np.clip(boxes * scale, 0, scale).astype(np.int64)
+        valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
         
         # Draw bounding boxes and labels
-        for pred in predictions:
-            bbox = pred.get('bbox', [0, 0, 0, 0])
+        for pred, (x1, y1, x2, y2), is_valid in zip(predictions, boxes.tolist(), valid.tolist()):
+            if not is_valid:
+                continue
+            
             class_name = pred.get('displayName', 'Unknown')
             confidence = pred.get('confidence', 0.0)
             
-            # Convert normalized coordinates to pixel coordinates
-            width, height = image.size
-            x1 = int(bbox[0] * width)
-            y1 = int(bbox[1] * height)
-            x2 = int(bbox[2] * width)
-            y2 = int(bbox[3] * height)
-            
             # Draw bounding box
             draw.rectangle([x1, y1, x2, y2], outline='red', width=3)
             
             # Draw label background
             label = f"{class_name}: {confidence:.2f}"
-            bbox_text = draw.textbbox((x1, y1 - 20), label, font=font)
+            left, top, right, bottom = get_label_bbox(label)
+            bbox_text = (x1 + left, y1 - 20 + top, x1 + right, y1 - 20 + bottom)
             draw.rectangle(bbox_text, fill='red')
             
             # Draw label text
@@ -224,7 +266,9 @@ def create_annotated_image(file, predictions):
         # Convert to base64 for sending to frontend
         buffer = BytesIO()
         image.save(buffer, format='JPEG')
-        img_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        # Encode straight from the buffer's memory instead of a getvalue() copy
+        with buffer.getbuffer() as view:
+            img_str = base64.b64encode(view).decode('ascii')
         
         return f"data:image/jpeg;base64,{img_str}"
         